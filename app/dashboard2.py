@@ -5,7 +5,8 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from configparser import ConfigParser
-from pg_utils import get_connection
+from pg_utils import read_sql, get_daily_rollup, get_monthly_payee_rollup, get_dashboard_bounds
+from schema import pending_migrations
 from datetime import datetime, timedelta
 import numpy as np
 
@@ -183,21 +184,51 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ---------- DB CONNECTION ----------
+@st.cache_data(ttl=60)
+def load_pending_migrations():
+    """
+    Migrations the database still lacks. The dashboard never applies them:
+    some rewrite or lock the expenses table, which a page view must not do.
+    """
+    return pending_migrations()
+
 @st.cache_data(ttl=300)
-def load_data():
-    conn = get_connection()
+def load_bounds():
+    """Filter choices and ranges, read from the rollups (no row scan)"""
+    return get_dashboard_bounds()
+
+@st.cache_data(ttl=300)
+def load_data(start, end, categories, txn_types, min_amount, max_amount):
+    """
+    Raw rows matching the filters, filtered in SQL. Only the per-transaction
+    views (table, box plot, sunburst, payees) and the amount filter need these.
+    """
     query = """
         SELECT
             txn_date,
             amount,
-            category,
-            txn_type,
-            paid_to
-        FROM expenses
+            COALESCE(category, 'Unknown') AS category,
+            COALESCE(txn_type, 'Unknown') AS txn_type,
+            paid_to,
+            COALESCE(m.canonical_name, e.paid_to) AS merchant
+        FROM expenses e
+        LEFT JOIN merchants m ON m.merchant_id = e.merchant_id
+        WHERE txn_date >= %(start)s AND txn_date <= %(end)s
+          AND COALESCE(category, 'Unknown') = ANY(%(categories)s)
+          AND COALESCE(txn_type, 'Unknown') = ANY(%(txn_types)s)
+          AND amount BETWEEN %(min_amount)s AND %(max_amount)s
         ORDER BY txn_date DESC
     """
-    df = pd.read_sql(query, conn)
-    conn.close()
+    df = read_sql(query, params={
+        "start": start,
+        "end": end,
+        "categories": list(categories),
+        "txn_types": list(txn_types),
+        "min_amount": min_amount,
+        "max_amount": max_amount
+    })
+    df['amount'] = df['amount'].astype(float)
+    df['txn_count'] = 1
     
     # Add derived columns
     df['txn_date'] = pd.to_datetime(df['txn_date'])
@@ -207,14 +238,29 @@ def load_data():
     
     return df
 
+@st.cache_data(ttl=300)
+def load_rollups():
+    """Pre-aggregated daily and monthly-payee totals maintained by the insert path"""
+    daily = get_daily_rollup()
+    daily['amount'] = daily['amount'].astype(float)
+    daily['txn_date'] = pd.to_datetime(daily['txn_date'])
+    daily['month'] = daily['txn_date'].dt.to_period('M').astype(str)
+    daily['day_of_week'] = daily['txn_date'].dt.day_name()
+
+    payees = get_monthly_payee_rollup()
+    payees['amount'] = payees['amount'].astype(float)
+    payees['month'] = pd.to_datetime(payees['month'])
+    return daily, payees
+
 # ---------- HELPER FUNCTIONS ----------
-from llm_query import chatbot_ans
-def process_chatbot_query(query, df):
+def process_chatbot_query(query):
     """Process natural language queries about expenses"""
     query_lower = query.lower()
     # Initialize response
     response = ""
     try:
+        # Imported on the first question so dashboard start-up skips the LLM/RAG stack
+        from llm_query import chatbot_ans
         response = chatbot_ans(query_lower)
     except Exception as e:
         response = f"❌ Sorry, I couldn't process that query. Error: {str(e)}"
@@ -224,8 +270,13 @@ def process_chatbot_query(query, df):
 # ---------- MAIN UI ----------
 st.markdown("<h1>💰 Personal Expense Analytics Dashboard</h1>", unsafe_allow_html=True)
 
-# Load data
-df = load_data()
+pending = load_pending_migrations()
+if pending:
+    st.error(
+        f"⚠️ The database schema is behind (pending migrations: {', '.join(map(str, pending))}). "
+        "Run `python db/schema.py` or the daily cron job, then reload this page."
+    )
+    st.stop()
 
 # ---------- SIDEBAR - CHATBOT ----------
 with st.sidebar:
@@ -245,7 +296,7 @@ with st.sidebar:
             st.session_state.chat_history.append({"role": "user", "content": user_query})
             
             # Get bot response
-            bot_response = process_chatbot_query(user_query, df)
+            bot_response = process_chatbot_query(user_query)
             st.session_state.chat_history.append({"role": "bot", "content": bot_response})
     
     # Display chat history
@@ -331,7 +382,7 @@ if st.session_state.pdf_password_required:
             # Save PDF temporarily
             import tempfile
             import os
-            from extract_statement import extract_bank_statement
+            from parser_registry import parse_statement
             from categorise_emails import categorize
             from normalize_functions import add_hash
             from pg_utils import insert_expense
@@ -347,7 +398,7 @@ if st.session_state.pdf_password_required:
                 with st.spinner('🔄 Processing PDF... Please wait'):
                     try:
                         # Step 1: Extract transactions from PDF
-                        pdf_result = extract_bank_statement(temp_pdf_path, pdf_password)
+                        pdf_result = parse_statement(temp_pdf_path, pdf_password)
                         
                         if pdf_result and len(pdf_result) > 0:
                             # Step 2: Categorize transactions
@@ -356,23 +407,30 @@ if st.session_state.pdf_password_required:
                             # Step 3: Add hash
                             hashed_results = add_hash(categorized_result)
                             
-                            # Step 4: Insert into database
-                            insert_expense(hashed_results)
+                            # Step 4: Insert into database. Handled here so a DB error
+                            # (e.g. "password authentication failed") is not taken
+                            # for a wrong PDF password by the handler below.
+                            try:
+                                insert_expense(hashed_results)
+                            except Exception as db_error:
+                                st.error(f"❌ Saving transactions failed: {db_error}")
+                                st.session_state.pdf_password_required = False
+                                st.session_state.pdf_file_data = None
+                            else:
+                                # Success!
+                                st.success(f"✅ Successfully processed {len(pdf_result)} transactions from {st.session_state.pdf_filename}!")
+                                st.balloons()
                             
-                            # Success!
-                            st.success(f"✅ Successfully processed {len(pdf_result)} transactions from {st.session_state.pdf_filename}!")
-                            st.balloons()
+                                # Reset state
+                                st.session_state.pdf_password_required = False
+                                st.session_state.pdf_file_data = None
+                                st.session_state.password_attempts = 0
                             
-                            # Reset state
-                            st.session_state.pdf_password_required = False
-                            st.session_state.pdf_file_data = None
-                            st.session_state.password_attempts = 0
-                            
-                            # Reload dashboard
-                            st.info("🔄 Reloading dashboard with new data...")
-                            import time
-                            time.sleep(2)
-                            st.rerun()
+                                # Reload dashboard
+                                st.info("🔄 Reloading dashboard with new data...")
+                                import time
+                                time.sleep(2)
+                                st.rerun()
                         else:
                             st.warning("⚠️ No transactions found in the PDF.")
                             st.session_state.pdf_password_required = False
@@ -400,67 +458,97 @@ if st.session_state.pdf_password_required:
 
 
 # ---------- FILTERS ----------
+all_category_options, all_txn_types, first_date, last_date, min_amount, max_amount = load_bounds()
+if first_date is None:
+    st.info("No transactions yet. Upload a statement or wait for the daily sync.")
+    st.stop()
+min_amount, max_amount = float(min_amount), float(max_amount)
+
 st.markdown("### 🔍 Filters")
 col1, col2, col3, col4 = st.columns(4)
 
 with col1:
     category_filter = st.multiselect(
         "📁 Category",
-        options=sorted(df["category"].unique()),
-        default=df["category"].unique()
+        options=sorted(all_category_options),
+        default=all_category_options
     )
 
 with col2:
     txn_type_filter = st.multiselect(
         "💳 Transaction Type",
-        options=df["txn_type"].unique(),
-        default=df["txn_type"].unique()
+        options=all_txn_types,
+        default=all_txn_types
     )
 
 with col3:
     date_range = st.date_input(
         "📅 Date Range",
-        [df["txn_date"].min(), df["txn_date"].max()]
+        [first_date, last_date]
     )
 
 with col4:
     amount_range = st.slider(
         "💵 Amount Range",
-        min_value=float(df["amount"].min()),
-        max_value=float(df["amount"].max()),
-        value=(float(df["amount"].min()), float(df["amount"].max()))
+        min_value=min_amount,
+        max_value=max_amount,
+        value=(min_amount, max_amount)
     )
 
-# Apply filters with validation
+# Apply filters with validation.
+# KPIs, trend charts and the budget tab are computed from the rollups; raw rows
+# (date/category/type/amount filtered in SQL) feed only the per-transaction
+# views, and the aggregates too when the amount filter is narrowed.
+daily_rollup, payee_rollup = load_rollups()
+empty_rows = pd.DataFrame(columns=['txn_date', 'amount', 'category', 'txn_type', 'paid_to', 'merchant', 'txn_count', 'month', 'day_of_week', 'week'])
 try:
     if len(category_filter) == 0 or len(txn_type_filter) == 0:
         st.warning("⚠️ Please select at least one category and transaction type to view data.")
-        filtered_df = pd.DataFrame(columns=df.columns)
+        filtered_df = empty_rows
+        agg_df = daily_rollup.iloc[0:0]
     else:
-        filtered_df = df[
-            (df["category"].isin(category_filter)) &
-            (df["txn_type"].isin(txn_type_filter)) &
-            (df["txn_date"].between(pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1]))) &
-            (df["amount"].between(amount_range[0], amount_range[1]))
-        ]
+        filtered_df = load_data(
+            date_range[0], date_range[1], tuple(category_filter), tuple(txn_type_filter),
+            amount_range[0], amount_range[1]
+        )
+        if amount_range[0] <= min_amount and amount_range[1] >= max_amount:
+            agg_df = daily_rollup[
+                (daily_rollup["category"].isin(category_filter)) &
+                (daily_rollup["txn_type"].isin(txn_type_filter)) &
+                (daily_rollup["txn_date"].between(pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1])))
+            ]
+        else:
+            agg_df = filtered_df
 except Exception as e:
     st.error("⚠️ Error applying filters. Please check your selections.")
-    filtered_df = pd.DataFrame(columns=df.columns)
+    filtered_df = empty_rows
+    agg_df = daily_rollup.iloc[0:0]
+
+# Payee rollup is monthly, so only usable when the date and amount filters are untouched
+payee_rollup_df = None
+if (agg_df is not filtered_df and len(date_range) == 2
+        and pd.Timestamp(date_range[0]) <= pd.Timestamp(first_date)
+        and pd.Timestamp(date_range[1]) >= pd.Timestamp(last_date)):
+    payee_rollup_df = payee_rollup[
+        (payee_rollup["category"].isin(category_filter)) &
+        (payee_rollup["txn_type"].isin(txn_type_filter))
+    ]
 
 st.markdown("---")
 
 # ---------- KPI METRICS ----------
 st.markdown("### 📊 Key Metrics")
 
-debit_df = filtered_df[filtered_df["txn_type"] == "Debit"] if len(filtered_df) > 0 else pd.DataFrame()
-credit_df = filtered_df[filtered_df["txn_type"] == "Credit"] if len(filtered_df) > 0 else pd.DataFrame()
+debit_df = filtered_df[filtered_df["txn_type"] == "Debit"]
+debit_agg_df = agg_df[agg_df["txn_type"] == "Debit"]
+credit_agg_df = agg_df[agg_df["txn_type"] == "Credit"]
 
-total_spent = debit_df["amount"].sum() if len(debit_df) > 0 else 0
-total_received = credit_df["amount"].sum() if len(credit_df) > 0 else 0
+total_spent = debit_agg_df["amount"].sum()
+total_received = credit_agg_df["amount"].sum()
 net_balance = total_received - total_spent
-txn_count = len(filtered_df)
-avg_transaction = filtered_df["amount"].mean() if len(filtered_df) > 0 else 0
-top_category = debit_df.groupby("category")["amount"].sum().idxmax() if len(debit_df) > 0 else "N/A"
+txn_count = int(agg_df["txn_count"].sum())
+avg_transaction = agg_df["amount"].sum() / txn_count if txn_count > 0 else 0
+top_category = debit_agg_df.groupby("category")["amount"].sum().idxmax() if len(debit_agg_df) > 0 else "N/A"
 
 kpi1, kpi2, kpi3, kpi4, kpi5, kpi6 = st.columns(6)
 
@@ -499,8 +587,8 @@ with tab1:
     
     with col1:
         st.markdown("#### 🎯 Expenses by Category")
-        if len(debit_df) > 0:
-            category_totals = debit_df.groupby("category")["amount"].sum().reset_index()
+        if len(debit_agg_df) > 0:
+            category_totals = debit_agg_df.groupby("category")["amount"].sum().reset_index()
             fig_pie = px.pie(
                 category_totals,
                 values="amount",
@@ -522,7 +610,7 @@ with tab1:
     
     with col2:
         st.markdown("#### 📊 Monthly Comparison")
-        monthly_data = filtered_df.groupby(['month', 'txn_type'])['amount'].sum().reset_index()
+        monthly_data = agg_df.groupby(['month', 'txn_type'])['amount'].sum().reset_index()
         fig_bar = px.bar(
             monthly_data,
             x='month',
@@ -567,7 +655,7 @@ with tab1:
         }
     
     # Get all available categories from the data
-    all_categories = sorted(df['category'].unique().tolist())
+    all_categories = sorted(all_category_options)
     
     # Category Selection Section (Always Visible)
     st.markdown("##### 📁 Select Categories for Each Budget Group")
@@ -708,9 +796,9 @@ with tab1:
     # Calculate actual spending for each budget category
     # Use date-filtered data to respect the date range filter
     # Filter data by selected date range
-    date_filtered_df = df[
-        (df["txn_date"] >= pd.Timestamp(date_range[0])) &
-        (df["txn_date"] <= pd.Timestamp(date_range[1]))
+    date_filtered_df = daily_rollup[
+        (daily_rollup["txn_date"] >= pd.Timestamp(date_range[0])) &
+        (daily_rollup["txn_date"] <= pd.Timestamp(date_range[1]))
     ]
     
     debit_df_budget = date_filtered_df[date_filtered_df["txn_type"] == "Debit"]
@@ -838,7 +926,7 @@ with tab1:
 with tab2:
     # Row 1: Line Chart
     st.markdown("#### 📈 Daily Expense Trend")
-    daily_expenses = debit_df.groupby("txn_date")["amount"].sum().reset_index()
+    daily_expenses = debit_agg_df.groupby("txn_date")["amount"].sum().reset_index() if len(debit_agg_df) > 0 else pd.DataFrame(columns=["txn_date", "amount"])
     fig_line = px.area(
         daily_expenses,
         x="txn_date",
@@ -860,7 +948,7 @@ with tab2:
     
     with col1:
         st.markdown("#### 📅 Spending by Day of Week")
-        dow_data = debit_df.groupby("day_of_week")["amount"].sum().reset_index()
+        dow_data = debit_agg_df.groupby("day_of_week")["amount"].sum().reset_index() if len(debit_agg_df) > 0 else pd.DataFrame(columns=["day_of_week", "amount"])
         # Order days properly
         day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
         dow_data['day_of_week'] = pd.Categorical(dow_data['day_of_week'], categories=day_order, ordered=True)
@@ -990,8 +1078,8 @@ with tab3:
     
     # Waterfall Chart
     st.markdown("#### 💧 Cash Flow Waterfall")
-    if len(filtered_df) > 0:
-        monthly_flow = filtered_df.groupby(['month', 'txn_type'])['amount'].sum().unstack(fill_value=0)
+    if len(agg_df) > 0:
+        monthly_flow = agg_df.groupby(['month', 'txn_type'])['amount'].sum().unstack(fill_value=0)
         
         if 'Credit' in monthly_flow.columns and 'Debit' in monthly_flow.columns:
             monthly_flow['Net'] = monthly_flow['Credit'] - monthly_flow['Debit']
@@ -1055,12 +1143,14 @@ with tab4:
     
     # Top Spenders
     st.markdown("#### 🏆 Top 10 Payees")
-    top_payees = debit_df.groupby('paid_to')['amount'].sum().sort_values(ascending=False).head(10).reset_index()
+    payee_source = payee_rollup_df[payee_rollup_df['txn_type'] == 'Debit'] if payee_rollup_df is not None else debit_df
+    # Grouped by canonical merchant, so spelling variants of one payee add up
+    top_payees = payee_source.groupby('merchant')['amount'].sum().sort_values(ascending=False).head(10).reset_index() if len(payee_source) > 0 else pd.DataFrame(columns=['merchant', 'amount'])
     
     fig_top = px.bar(
         top_payees,
         x='amount',
-        y='paid_to',
+        y='merchant',
         orientation='h',
         color='amount',
         color_continuous_scale='Reds'
@@ -1,9 +1,34 @@
 import psycopg2
+from psycopg2 import pool
+from psycopg2.extras import execute_values
 from configparser import ConfigParser
+from contextlib import contextmanager
+import threading
+import json
 import os
+import re
 import pandas as pd
+from datetime import datetime
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_PATH = os.path.join(BASE_DIR, "config.ini")
+# Rows the database rejected for their data (bad amount/date); one JSON object per line
+REJECTED_PATH = os.path.join(BASE_DIR, "rejected_expenses.jsonl")
+
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = 10
+# How long checkout_connection waits for a free connection before giving up
+POOL_WAIT_SECONDS = 30
+
+_db_config = None
+_pool = None
+# One slot per pooled connection: getconn() raises PoolError when the pool is
+# exhausted instead of waiting, so callers queue on this semaphore first
+_pool_slots = None
+_pool_lock = threading.Lock()
+# id(conn) -> (pool, slots) it was checked out from, so it goes back to the right one
+_checkouts = {}
+_partitioned = None
+
 def load_db_config(path=CONFIG_PATH):
     config = ConfigParser()
     config.read(path)
@@ -13,13 +38,136 @@ def load_db_config(path=CONFIG_PATH):
         "user": config.get("DATABASE", "user"),
         "password": config.get("DATABASE", "password"),
         "host": config.get("DATABASE", "host"),
-        "port": config.get("DATABASE", "port")
+        "port": config.get("DATABASE", "port"),
+        "minconn": config.getint("DATABASE", "pool_min", fallback=POOL_MIN_CONN),
+        "maxconn": config.getint("DATABASE", "pool_max", fallback=POOL_MAX_CONN)
     }
     return db_config
 
 
+def get_db_config():
+    """Parsed DB config, read from config.ini only once per process"""
+    global _db_config
+    if _db_config is None:
+        _db_config = load_db_config()
+    return _db_config
+
+
+def get_pool():
+    """
+    Process-wide ThreadedConnectionPool, created lazily on first use.
+    Shared by the cron job, the dashboard and the chatbot.
+    """
+    global _pool, _pool_slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                db_config = get_db_config()
+                _pool_slots = threading.BoundedSemaphore(db_config["maxconn"])
+                _pool = pool.ThreadedConnectionPool(
+                    db_config["minconn"],
+                    db_config["maxconn"],
+                    database=db_config["dbname"],
+                    user=db_config["user"],
+                    password=db_config["password"],
+                    host=db_config["host"],
+                    port=db_config["port"]
+                )
+    return _pool
+
+
+def close_pool():
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _pool_slots = None
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def checkout_connection():
+    """
+    Take a connection from the pool, replacing it if the server dropped it.
+    Waits up to POOL_WAIT_SECONDS when every connection is in use.
+    Always hand it back with release_connection().
+    """
+    p = get_pool()
+    slots = _pool_slots
+    if not slots.acquire(timeout=POOL_WAIT_SECONDS):
+        raise pool.PoolError(f"no database connection free after {POOL_WAIT_SECONDS}s")
+    try:
+        conn = p.getconn()
+        if not _is_healthy(conn):
+            p.putconn(conn, close=True)
+            conn = p.getconn()
+            if not _is_healthy(conn):
+                p.putconn(conn, close=True)
+                raise psycopg2.OperationalError("new database connection failed its health check")
+    except BaseException:
+        slots.release()
+        raise
+    _checkouts[id(conn)] = (p, slots)
+    return conn
+
+
+def release_connection(conn, discard=False):
+    if conn is None:
+        return
+    p, slots = _checkouts.pop(id(conn), (None, None))
+    try:
+        if p is None or p.closed:
+            # Pool closed (close_pool) since checkout: nothing to return it to
+            conn.close()
+            return
+        if not discard and not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        p.putconn(conn, close=discard or bool(conn.closed))
+    finally:
+        if slots is not None:
+            slots.release()
+
+
+@contextmanager
+def pooled_connection():
+    """
+    Usage:
+        with pooled_connection() as conn:
+            ...
+    Commits on success, rolls back on error, and returns the connection to the pool.
+    """
+    conn = checkout_connection()
+    discard = False
+    try:
+        yield conn
+        conn.commit()
+    except psycopg2.OperationalError:
+        discard = True
+        raise
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        release_connection(conn, discard=discard)
+
+
 def get_connection():
-    db_config = load_db_config()
+    db_config = get_db_config()
     try :
         conn = psycopg2.connect(
         database=db_config["dbname"],
@@ -65,110 +213,656 @@ def insert_expense_old(expenses):
     conn.close()
     return None
 
-def insert_expense(expenses):
-    conn = get_connection()
-    if conn is None:
-        print("No connection established")
+# --------------------
+#  Partitions
+# --------------------
+# Partitioning is optional (see schema.partition_expenses). When expenses is a
+# range-partitioned table the insert path creates the month partitions it needs
+# and quarantines undated rows (txn_date is NOT NULL there).
+
+def is_partitioned(cur):
+    cur.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = 'expenses'
+        )
+    """)
+    return cur.fetchone()[0]
+
+def partition_name(month_start):
+    return f"expenses_p{month_start.year}{month_start.month:02d}"
+
+def create_month_partition(cur, month_start):
+    """Create the partition holding month_start's month if it is missing"""
+    name = partition_name(month_start)
+    cur.execute("SELECT to_regclass(%s)", (name,))
+    if cur.fetchone()[0] is not None:
         return
+    if month_start.month == 12:
+        next_month = month_start.replace(year=month_start.year + 1, month=1)
+    else:
+        next_month = month_start.replace(month=month_start.month + 1)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {name} PARTITION OF expenses
+        FOR VALUES FROM ('{month_start.isoformat()}') TO ('{next_month.isoformat()}')
+    """)
 
-    cur = conn.cursor()
+def expenses_partitioned():
+    """is_partitioned(), checked once per process"""
+    global _partitioned
+    if _partitioned is None:
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                _partitioned = is_partitioned(cur)
+    return _partitioned
+
+def ensure_partitions(cur, dates):
+    """
+    Make sure every month in dates has a partition before inserting.
+    Dates are parsed by Postgres itself so they route exactly like the INSERT will.
+    """
+    global _partitioned
+    if _partitioned is None:
+        _partitioned = is_partitioned(cur)
+    if not _partitioned:
+        return
+    values = [str(d) for d in dates if d]
+    if not values:
+        return
+    cur.execute(
+        "SELECT DISTINCT date_trunc('month', d::date)::date FROM unnest(%s::text[]) AS d",
+        (values,)
+    )
+    for (month_start,) in cur.fetchall():
+        create_month_partition(cur, month_start)
+
+class InsertError(Exception):
+    """Some rows of a load failed for a non-data reason; the rest were committed"""
 
+    def __init__(self, inserted, duplicates, failed):
+        super().__init__(f"{len(failed)} of {len(inserted) + len(duplicates) + len(failed)} rows failed to insert")
+        self.inserted = inserted
+        self.duplicates = duplicates
+        self.failed = failed
+
+def quarantine_expense(expense, error, path=REJECTED_PATH):
+    """Append a row the database refused to the rejected-rows file, for a manual fix"""
+    record = {
+        "rejected_at": datetime.now().isoformat(timespec="seconds"),
+        "error": str(error).strip(),
+        "expense": expense
+    }
+    with open(path, "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+def reject_undated(expenses):
+    """
+    Quarantine rows without a Date. A partitioned expenses has txn_date NOT NULL,
+    since its unique key (hashcode, txn_date) cannot deduplicate NULL dates.
+    """
+    kept = []
     for expense in expenses:
-        try:
-            cur.execute("""
-                INSERT INTO public.expenses (amount, paid_to, reference_no, txn_date, category, hashcode, txn_type)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
+        if expense["Date"]:
+            kept.append(expense)
+        else:
+            print("⚠️ Row has no date, quarantined in", REJECTED_PATH, ":", expense["hashcode"])
+            quarantine_expense(expense, "txn_date is required once expenses is partitioned")
+    return kept
+
+def insert_expense_rowwise(expenses):
+    """
+    One INSERT and commit per row. Returns (inserted_hashcodes, duplicate_hashcodes)
+    like bulk_insert_expenses. Rows rejected for their data (DataError /
+    IntegrityError, e.g. "1,234.00" as an amount) are quarantined and skipped,
+    since retrying them can never succeed. Raises OperationalError if the
+    connection is lost and InsertError (after committing the good rows) if any
+    row failed for another reason.
+    """
+    conn = checkout_connection()
+
+    inserted, duplicates, failed = [], [], []
+    discard = False
+    try:
+        with conn.cursor() as cur:
+            for expense in expenses:
+                try:
+                    ensure_partitions(cur, [expense["Date"]])
+                    cur.execute("""
+                        INSERT INTO public.expenses (amount, paid_to, reference_no, txn_date, category, hashcode, txn_type, merchant_id)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    _expense_values(expense))
+                    apply_rollups(cur, [expense["hashcode"]])
+                    conn.commit()
+
+                    print("Inserted:", expense["hashcode"])
+                    inserted.append(expense["hashcode"])
+
+                except psycopg2.errors.UniqueViolation:
+                    conn.rollback()
+                    print("Duplicate skipped:", expense["hashcode"])
+                    duplicates.append(expense["hashcode"])
+
+                except psycopg2.OperationalError:
+                    discard = True
+                    raise
+
+                except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                    conn.rollback()
+                    print("⚠️ Row rejected, quarantined in", REJECTED_PATH, ":", expense["hashcode"], e)
+                    quarantine_expense(expense, e)
+
+                except Exception as e:
+                    conn.rollback()
+                    print("❌ Insert FAILED for:", expense)
+                    print("❌ ERROR:", e)
+                    failed.append(expense["hashcode"])
+    finally:
+        release_connection(conn, discard=discard)
+
+    if failed:
+        raise InsertError(inserted, duplicates, failed)
+    return inserted, duplicates
+
+INSERT_BATCH_SIZE = 1000
+
+def _expense_values(expense):
+    return (
+        expense["Amount"],
+        expense["Paid_to"],
+        expense["Reference_number"],
+        expense["Date"],
+        expense["Category"],
+        expense["hashcode"],
+        expense["Type"],
+        expense.get("merchant_id")
+    )
+
+def bulk_insert_expenses(expenses, page_size=INSERT_BATCH_SIZE):
+    """
+    Insert a whole batch with multi-row VALUES and ON CONFLICT (hashcode) DO NOTHING,
+    in one transaction.
+    Returns (inserted_hashcodes, duplicate_hashcodes).
+    """
+    # Same hashcode twice in one batch is a duplicate too; keep the first one
+    unique = {}
+    for expense in expenses:
+        unique.setdefault(expense["hashcode"], expense)
+    if not unique:
+        return [], []
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            ensure_partitions(cur, [e["Date"] for e in unique.values()])
+            # Unique on hashcode, or (hashcode, txn_date) once partitioned; the
+            # two agree only because schema.partition_expenses requires Date in [HASH] keys
+            rows = execute_values(cur, """
+                INSERT INTO public.expenses (amount, paid_to, reference_no, txn_date, category, hashcode, txn_type, merchant_id)
+                VALUES %s
+                ON CONFLICT DO NOTHING
+                RETURNING hashcode
             """,
-            (
-                expense["Amount"],
-                expense["Paid_to"],
-                expense["Reference_number"],
-                expense["Date"],
-                expense["Category"],
-                expense["hashcode"],
-                expense["Type"]
-            ))
+            [_expense_values(e) for e in unique.values()],
+            page_size=page_size,
+            fetch=True)
+            apply_rollups(cur, [r[0] for r in rows])
 
-            print("Inserted:", expense["hashcode"])
+    inserted_set = {r[0] for r in rows}
+    inserted = [h for h in unique if h in inserted_set]
 
-        except psycopg2.errors.UniqueViolation:
-            conn.rollback()
-            print("Duplicate skipped:", expense["hashcode"])
+    # Every input row that did not produce an insert is reported as a duplicate
+    seen = set()
+    duplicates = []
+    for expense in expenses:
+        h = expense["hashcode"]
+        if h in inserted_set and h not in seen:
+            seen.add(h)
+            continue
+        duplicates.append(h)
+    return inserted, duplicates
 
-        except Exception as e:
-            conn.rollback()
-            print("❌ Insert FAILED for:", expense)
-            print("❌ ERROR:", e)
-        finally :
-            conn.commit()
-    cur.close()
-    conn.close()
+def insert_expense(expenses):
+    """
+    Bulk path for the ETL: one round trip per INSERT_BATCH_SIZE rows and one commit.
+    Falls back to row-by-row inserts if the batch is rejected (e.g. one bad date),
+    so a single malformed row does not drop the whole load.
+
+    Returns (inserted_hashcodes, duplicate_hashcodes); rows with bad data are
+    quarantined (see insert_expense_rowwise) and in neither list. Raises
+    psycopg2.OperationalError when the database is unreachable and InsertError
+    when rows failed for any other reason, so callers never mistake a failed
+    load for an empty one.
+    """
+    expenses = list(expenses)
+    if any(not e["Date"] for e in expenses) and expenses_partitioned():
+        expenses = reject_undated(expenses)
+    try:
+        inserted, duplicates = bulk_insert_expenses(expenses)
+    except psycopg2.OperationalError:
+        print("No connection established")
+        raise
+    except psycopg2.Error as e:
+        print("⚠️ Bulk insert failed, retrying row by row:", e)
+        return insert_expense_rowwise(expenses)
+
+    for h in inserted:
+        print("Inserted:", h)
+    for h in duplicates:
+        print("Duplicate skipped:", h)
+    return inserted, duplicates
+
+def _row_to_dict(r):
+    return {
+        "hashcode": r[0],
+        "txn_date": str(r[1]),
+        "category": r[2],
+        "txn_type": r[3],
+        "amount": int(r[4]),
+        "paid_to": r[5]
+    }
 
 def get_all_data():
-    conn = get_connection()
-    if conn is None:
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('''Select hashcode,txn_date,category,txn_type,amount,paid_to from expenses;''')
+                rows = cur.fetchall()
+    except psycopg2.OperationalError:
         print("No connection established")
         return None
-    cur = conn.cursor()
-    cur.execute('''Select hashcode,txn_date,category,txn_type,amount,paid_to from expenses;''')
-    rows = cur.fetchall()
-    conn.close()
 
-    return [
-        {
-            "hashcode": r[0],
-            "txn_date": str(r[1]),
-            "category": r[2],
-            "txn_type": r[3],
-            "amount": int(r[4]),
-            "paid_to": r[5]
-        }
-        for r in rows
-    ]
+    return [_row_to_dict(r) for r in rows]
 
 
+STREAM_ITERSIZE = 2000
+
+def iter_all_data(batch_size=STREAM_ITERSIZE, itersize=STREAM_ITERSIZE):
+    """
+    Stream the expenses table through a named (server-side) cursor.
+    Yields lists of at most batch_size row dicts; only itersize rows are
+    pulled from the server per network round trip.
+    """
+    with pooled_connection() as conn:
+        with conn.cursor(name="expenses_stream") as cur:
+            cur.itersize = itersize
+            cur.execute('''Select hashcode,txn_date,category,txn_type,amount,paid_to from expenses;''')
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [_row_to_dict(r) for r in rows]
+
+def has_column(table, column):
+    """Whether the column exists (checked in information_schema, no DDL or locks)"""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+            """, (table, column))
+            return cur.fetchone() is not None
+
+def current_xmin():
+    """
+    Oldest transaction id still running, as an int. Every transaction with a
+    lower id has finished, so its rows are visible to any later snapshot.
+    """
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text")
+            return int(cur.fetchone()[0])
+
+def iter_data_since(since_xid, batch_size=STREAM_ITERSIZE, itersize=STREAM_ITERSIZE):
+    """
+    Stream rows written by transactions with id >= since_xid (expenses.ingest_xid).
+    Pass a current_xmin() taken before the previous read: rows committed late by
+    a transaction that was still open then are picked up now.
+    """
+    with pooled_connection() as conn:
+        with conn.cursor(name="expenses_since") as cur:
+            cur.itersize = itersize
+            cur.execute('''
+                Select hashcode,txn_date,category,txn_type,amount,paid_to
+                from expenses
+                where ingest_xid >= %s::text::xid8;
+            ''', (str(since_xid),))
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [_row_to_dict(r) for r in rows]
+
 from datetime import date
 def get_today_data():
-    conn = get_connection()
-    cur = conn.cursor()
-
     today = date.today()
 
-    cur.execute("""
-        SELECT
-            hashcode,
-            txn_date,
-            category,
-            txn_type,
-            amount,
-            paid_to
-        FROM expenses
-        WHERE txn_date = %s
-    """, (today,))
-
-    rows = cur.fetchall()
-    conn.close()
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT
+                    hashcode,
+                    txn_date,
+                    category,
+                    txn_type,
+                    amount,
+                    paid_to
+                FROM expenses
+                WHERE txn_date = %s
+            """, (today,))
+            rows = cur.fetchall()
+
+    return [_row_to_dict(r) for r in rows]
+
+def get_labelled_merchants():
+    """[(paid_to, category)] with each payee's most frequent category (SIP rows have no payee)"""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT paid_to, mode() WITHIN GROUP (ORDER BY category)
+                FROM expenses
+                WHERE paid_to IS NOT NULL AND paid_to <> '' AND category IS NOT NULL
+                GROUP BY paid_to
+            """)
+            return cur.fetchall()
+
+_DOLLAR_TAG = re.compile(r"\$(?:[A-Za-z_][A-Za-z0-9_]*)?\$")
 
-    return [
-        {
-            "hashcode": r[0],
-            "txn_date": str(r[1]),
-            "category": r[2],
-            "txn_type": r[3],
-            "amount": int(r[4]),
-            "paid_to": r[5]
-        }
-        for r in rows
-    ]
+def single_statement(query):
+    """
+    query without its trailing semicolon, or None if it holds more than one
+    statement. Semicolons inside quotes, dollar quotes and comments are ignored.
+    """
+    query = query.strip().rstrip(";").strip()
+    i, n = 0, len(query)
+    while i < n:
+        c = query[i]
+        if c in "'\"":
+            end = query.find(c, i + 1)
+            # '' / "" inside a literal is an escaped quote: keep scanning after it
+            while end != -1 and query[end + 1:end + 2] == c:
+                end = query.find(c, end + 2)
+            if end == -1:
+                return None
+            i = end + 1
+        elif query.startswith("--", i):
+            end = query.find("\n", i)
+            i = n if end == -1 else end + 1
+        elif query.startswith("/*", i):
+            end = query.find("*/", i + 2)
+            if end == -1:
+                return None
+            i = end + 2
+        elif c == "$" and _DOLLAR_TAG.match(query, i):
+            tag = _DOLLAR_TAG.match(query, i).group()
+            end = query.find(tag, i + len(tag))
+            if end == -1:
+                return None
+            i = end + len(tag)
+        elif c == ";":
+            return None
+        else:
+            i += 1
+    return query or None
 
 def execute_query(query):
+    """
+    Run one chatbot-generated statement in a read-only session and roll it back.
+
+    Only a single statement is accepted: with several, a leading COMMIT would
+    end the read-only transaction and let the rest write. Postgres refuses
+    INSERT/UPDATE/DELETE/DDL in the read-only transaction. For a hard guarantee
+    point the chatbot at a database role with SELECT privileges only.
+    """
     #print("Query ",query)
-    conn = get_connection()
-    cur = conn.cursor()
+    statement = single_statement(query)
+    if statement is None:
+        print("❌ Refusing chatbot SQL that is not exactly one statement")
+        return None
+
+    conn = None
+    discard = False
     try:
-        cur.execute(query)
-        result = cur.fetchall()
+        conn = checkout_connection()
+        conn.set_session(readonly=True)
+        with conn.cursor() as cur:
+            cur.execute(statement)
+            result = cur.fetchall()
         if result :
             return result
+    except psycopg2.OperationalError:
+        discard = True
+        return None
     except :
-        return None
\ No newline at end of file
+        return None
+    finally:
+        if conn is not None and not discard and not conn.closed:
+            try:
+                conn.rollback()
+                conn.set_session(readonly=False)
+            except psycopg2.Error:
+                discard = True
+        # release_connection rolls back; nothing here is ever committed
+        release_connection(conn, discard=discard)
+
+def read_sql(query, params=None):
+    """pd.read_sql over a pooled connection"""
+    with pooled_connection() as conn:
+        return pd.read_sql(query, conn, params=params)
+
+
+# --------------------
+#  Rollups
+# --------------------
+# expense_daily_rollup         : txn_date x category x txn_type
+# expense_monthly_payee_rollup : month x category x txn_type x paid_to
+# Both are maintained by the insert path in the same transaction as the rows,
+# so dashboard / chatbot aggregates can read them instead of the raw table.
+# Manual UPDATE/DELETE on expenses is not folded in: after a manual fix run
+#   python db/schema.py --rebuild-rollups
+# (rebuild_rollups() is on demand only, never part of the daily cron run).
+# ROLLUP_DDL (and a first rebuild) is applied by schema migration 8 only.
+
+ROLLUP_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS expense_daily_rollup (
+        txn_date DATE NOT NULL,
+        category TEXT NOT NULL,
+        txn_type TEXT NOT NULL,
+        total NUMERIC NOT NULL DEFAULT 0,
+        txn_count BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (txn_date, category, txn_type)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS expense_monthly_payee_rollup (
+        month DATE NOT NULL,
+        category TEXT NOT NULL,
+        txn_type TEXT NOT NULL,
+        paid_to TEXT NOT NULL,
+        total NUMERIC NOT NULL DEFAULT 0,
+        txn_count BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (month, category, txn_type, paid_to)
+    )
+    """
+]
+
+DAILY_ROLLUP_UPSERT = """
+    INSERT INTO expense_daily_rollup (txn_date, category, txn_type, total, txn_count)
+    SELECT txn_date, COALESCE(category, 'Unknown'), COALESCE(txn_type, 'Unknown'), SUM(amount), COUNT(*)
+    FROM expenses
+    WHERE txn_date IS NOT NULL {where}
+    GROUP BY 1, 2, 3
+    ON CONFLICT (txn_date, category, txn_type) DO UPDATE
+    SET total = expense_daily_rollup.total + EXCLUDED.total,
+        txn_count = expense_daily_rollup.txn_count + EXCLUDED.txn_count
+"""
+
+PAYEE_ROLLUP_UPSERT = """
+    INSERT INTO expense_monthly_payee_rollup (month, category, txn_type, paid_to, total, txn_count)
+    SELECT date_trunc('month', txn_date)::date, COALESCE(category, 'Unknown'), COALESCE(txn_type, 'Unknown'),
+           COALESCE(paid_to, ''), SUM(amount), COUNT(*)
+    FROM expenses
+    WHERE txn_date IS NOT NULL {where}
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (month, category, txn_type, paid_to) DO UPDATE
+    SET total = expense_monthly_payee_rollup.total + EXCLUDED.total,
+        txn_count = expense_monthly_payee_rollup.txn_count + EXCLUDED.txn_count
+"""
+
+def apply_rollups(cur, hashcodes):
+    """Fold freshly inserted rows into the rollups (caller owns the transaction)"""
+    if not hashcodes:
+        return
+    cur.execute(DAILY_ROLLUP_UPSERT.format(where="AND hashcode = ANY(%s)"), (list(hashcodes),))
+    cur.execute(PAYEE_ROLLUP_UPSERT.format(where="AND hashcode = ANY(%s)"), (list(hashcodes),))
+
+ROLLUP_REBUILD = [
+    "DELETE FROM expense_daily_rollup",
+    "DELETE FROM expense_monthly_payee_rollup",
+    DAILY_ROLLUP_UPSERT.format(where=""),
+    PAYEE_ROLLUP_UPSERT.format(where="")
+]
+
+def rebuild_rollups():
+    """
+    Recompute both rollups from the raw table (after manual edits/deletes).
+    DELETE rather than TRUNCATE, so dashboard reads are not blocked meanwhile.
+    """
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            for statement in ROLLUP_REBUILD:
+                cur.execute(statement)
+
+def get_daily_rollup():
+    """DataFrame: txn_date, category, txn_type, amount, txn_count"""
+    return read_sql("""
+        SELECT txn_date, category, txn_type, total AS amount, txn_count
+        FROM expense_daily_rollup
+        ORDER BY txn_date
+    """)
+
+def get_dashboard_bounds():
+    """
+    Filter choices for the dashboard without reading the rows: categories,
+    types and the date span from expense_daily_rollup, the amount span from
+    expenses_amount_idx (schema migration 9).
+    Returns (categories, txn_types, first_date, last_date, min_amount, max_amount).
+    """
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT array_agg(DISTINCT category), array_agg(DISTINCT txn_type), MIN(txn_date), MAX(txn_date)
+                FROM expense_daily_rollup
+            """)
+            categories, txn_types, first_date, last_date = cur.fetchone()
+            cur.execute("SELECT MIN(amount), MAX(amount) FROM expenses")
+            min_amount, max_amount = cur.fetchone()
+    return categories or [], txn_types or [], first_date, last_date, min_amount, max_amount
+
+def get_monthly_payee_rollup():
+    """DataFrame: month, category, txn_type, paid_to, merchant, amount, txn_count"""
+    return read_sql("""
+        SELECT r.month, r.category, r.txn_type, r.paid_to,
+               COALESCE(m.canonical_name, r.paid_to) AS merchant,
+               r.total AS amount, r.txn_count
+        FROM expense_monthly_payee_rollup r
+        LEFT JOIN merchant_aliases a ON a.alias = r.paid_to
+        LEFT JOIN merchants m ON m.merchant_id = a.merchant_id
+        ORDER BY r.month
+    """)
+
+# --------------------
+# Canonical merchants
+# --------------------
+# merchants        : one row per real-world payee (merchant_key is the normalised form)
+# merchant_aliases : every raw paid_to string seen -> its merchant
+# expenses.merchant_id is filled at ingest (see etl/merchants.py)
+# MERCHANT_DDL is applied by schema migration 6 only; nothing here runs DDL,
+# so the dashboard and the insert paths never take ALTER TABLE locks.
+
+MERCHANT_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS merchants (
+        merchant_id SERIAL PRIMARY KEY,
+        canonical_name TEXT NOT NULL,
+        merchant_key TEXT NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS merchant_aliases (
+        alias TEXT PRIMARY KEY,
+        merchant_id INT NOT NULL REFERENCES merchants (merchant_id)
+    )
+    """,
+    "ALTER TABLE expenses ADD COLUMN IF NOT EXISTS merchant_id INT",
+    "CREATE INDEX IF NOT EXISTS expenses_merchant_id_idx ON expenses (merchant_id)"
+]
+
+def get_merchant_aliases():
+    """[(alias, merchant_id, canonical_name, merchant_key)]"""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT a.alias, m.merchant_id, m.canonical_name, m.merchant_key
+                FROM merchant_aliases a
+                JOIN merchants m ON m.merchant_id = a.merchant_id
+            """)
+            return cur.fetchall()
+
+def save_merchants(merchants, aliases):
+    """
+    merchants: [(merchant_key, canonical_name)] to create
+    aliases  : [(alias, merchant_key)] to record
+    One transaction. A key created meanwhile by another process keeps its
+    existing id and name. Returns {merchant_key: (merchant_id, canonical_name)}.
+    """
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            ids = {}
+            if merchants:
+                rows = execute_values(cur, """
+                    INSERT INTO merchants (merchant_key, canonical_name)
+                    VALUES %s
+                    ON CONFLICT (merchant_key) DO UPDATE SET merchant_key = EXCLUDED.merchant_key
+                    RETURNING merchant_key, merchant_id, canonical_name
+                """, merchants, fetch=True)
+                ids = {key: (merchant_id, name) for key, merchant_id, name in rows}
+
+            keys = sorted({key for _, key in aliases} - set(ids))
+            if keys:
+                cur.execute(
+                    "SELECT merchant_key, merchant_id, canonical_name FROM merchants WHERE merchant_key = ANY(%s)",
+                    (keys,)
+                )
+                ids.update({key: (merchant_id, name) for key, merchant_id, name in cur.fetchall()})
+
+            if aliases:
+                execute_values(cur, """
+                    INSERT INTO merchant_aliases (alias, merchant_id)
+                    VALUES %s
+                    ON CONFLICT (alias) DO NOTHING
+                """, [(alias, ids[key][0]) for alias, key in aliases if key in ids])
+    return ids
+
+def get_unassigned_payees():
+    """Distinct paid_to values of rows that have no merchant_id yet"""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT DISTINCT paid_to FROM expenses
+                WHERE merchant_id IS NULL AND paid_to IS NOT NULL AND paid_to <> ''
+            """)
+            return [r[0] for r in cur.fetchall()]
+
+def set_merchant_ids(pairs, page_size=INSERT_BATCH_SIZE):
+    """pairs: [(paid_to, merchant_id)]; fills merchant_id on rows that lack it"""
+    if not pairs:
+        return
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                UPDATE expenses e SET merchant_id = v.merchant_id
+                FROM (VALUES %s) AS v (paid_to, merchant_id)
+                WHERE e.paid_to = v.paid_to AND e.merchant_id IS NULL
+            """, pairs, page_size=page_size)
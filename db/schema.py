@@ -0,0 +1,199 @@
+"""
+Versioned schema for the expenses database.
+
+Each migration is (version, description, [statements]) and is applied once,
+in order, inside its own transaction. Applied versions are recorded in
+schema_version, so running this again is a no-op.
+
+Run:  python schema.py
+      PYTHONPATH=../etl python schema.py --partition     (optional, convert expenses to monthly partitions)
+      python schema.py --rebuild-rollups   (recompute rollups after editing expenses by hand)
+"""
+
+import sys
+import pg_utils
+from pg_utils import pooled_connection, is_partitioned, create_month_partition
+
+MIGRATIONS = [
+    (1, "expenses table", [
+        """
+        CREATE TABLE IF NOT EXISTS expenses (
+            amount NUMERIC,
+            paid_to TEXT,
+            reference_no TEXT,
+            txn_date DATE,
+            category TEXT,
+            hashcode TEXT,
+            txn_type TEXT
+        )
+        """
+    ]),
+    (2, "unique hashcode for dedup", [
+        "CREATE UNIQUE INDEX IF NOT EXISTS expenses_hashcode_key ON expenses (hashcode)"
+    ]),
+    (3, "filter index for txn_type / category / date range queries", [
+        "CREATE INDEX IF NOT EXISTS expenses_type_category_date_idx ON expenses (txn_type, category, txn_date)",
+        "CREATE INDEX IF NOT EXISTS expenses_txn_date_idx ON expenses (txn_date)"
+    ]),
+    (4, "trigram index for paid_to ILIKE '%..%'", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS expenses_paid_to_trgm_idx ON expenses USING gin (paid_to gin_trgm_ops)"
+    ]),
+    # Was the ingest_seq / inserted_at watermark, replaced by ingest_xid (7) and
+    # dropped by 10; kept as an empty step so version numbers stay the same
+    (5, "ingest sequence for incremental embedding sync (superseded)", []),
+    (6, "canonical merchants and expenses.merchant_id", pg_utils.MERCHANT_DDL),
+    (7, "inserting transaction id for the embedding sync watermark (Postgres 13+)", [
+        "ALTER TABLE expenses ADD COLUMN IF NOT EXISTS ingest_xid xid8 NOT NULL DEFAULT pg_current_xact_id()",
+        "CREATE INDEX IF NOT EXISTS expenses_ingest_xid_idx ON expenses (ingest_xid)"
+    ]),
+    (8, "dashboard rollup tables, filled from expenses", pg_utils.ROLLUP_DDL + pg_utils.ROLLUP_REBUILD),
+    (9, "amount index for the dashboard amount bounds", [
+        "CREATE INDEX IF NOT EXISTS expenses_amount_idx ON expenses (amount)"
+    ]),
+    (10, "drop the unused ingest_seq / inserted_at watermark columns", [
+        # Also drops expenses_ingest_seq_idx and the owned expenses_ingest_seq_seq
+        "ALTER TABLE expenses DROP COLUMN IF EXISTS ingest_seq",
+        "ALTER TABLE expenses DROP COLUMN IF EXISTS inserted_at"
+    ]),
+]
+
+
+# Advisory lock key shared by every process applying migrations (any constant works)
+MIGRATION_LOCK_KEY = 20260101
+
+
+def current_version(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cur.fetchone()[0]
+
+
+def apply_migrations(target=None):
+    """
+    Apply every pending migration up to target (default: latest).
+    Safe to run from several processes at once: each migration transaction
+    takes MIGRATION_LOCK_KEY and re-reads the version while holding it.
+    """
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+            version = current_version(cur)
+
+    applied = []
+    for number, description, statements in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+                # Another process may have applied it while we waited for the lock
+                version = current_version(cur)
+                if number <= version:
+                    continue
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                    (number, description)
+                )
+        print(f"Applied migration {number}: {description}")
+        applied.append(number)
+
+    if not applied:
+        print(f"Schema up to date (version {version})")
+    return applied
+
+
+def pending_migrations():
+    """Versions not applied yet. Read-only (no DDL, no lock), for processes that must not migrate"""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('schema_version')")
+            if cur.fetchone()[0] is None:
+                applied = set()
+            else:
+                cur.execute("SELECT version FROM schema_version")
+                applied = {r[0] for r in cur.fetchall()}
+    return [number for number, _, _ in MIGRATIONS if number not in applied]
+
+
+def partition_expenses():
+    """
+    Convert expenses into a table range-partitioned by month on txn_date.
+
+    Postgres requires unique indexes on a partitioned table to include the
+    partition key, so dedup uniqueness becomes (hashcode, txn_date). That
+    only matches hashcode dedup when Date is among the [HASH] keys, so the
+    conversion is refused otherwise. NULLs are distinct in a unique index, so
+    an undated row could never be deduplicated: txn_date becomes NOT NULL, the
+    conversion is refused while undated rows exist, and the insert path
+    quarantines undated rows. Runs in one transaction; safe to call again
+    once converted.
+    """
+    from normalize_functions import load_hash_keys
+    if "Date" not in load_hash_keys():
+        raise RuntimeError(
+            "Refusing to partition: Date is not in the [HASH] keys, so (hashcode, txn_date) "
+            "would let the same transaction in with a different date"
+        )
+
+    apply_migrations()
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            if is_partitioned(cur):
+                print("expenses is already partitioned")
+                return False
+
+            cur.execute("SELECT COUNT(*) FROM expenses WHERE txn_date IS NULL")
+            undated = cur.fetchone()[0]
+            if undated:
+                raise RuntimeError(
+                    f"Refusing to partition: {undated} rows have no txn_date and could not be "
+                    "deduplicated on (hashcode, txn_date); fix or delete them first"
+                )
+
+            cur.execute("ALTER TABLE expenses RENAME TO expenses_unpartitioned")
+            cur.execute("""
+                CREATE TABLE expenses (LIKE expenses_unpartitioned INCLUDING DEFAULTS)
+                PARTITION BY RANGE (txn_date)
+            """)
+            cur.execute("ALTER TABLE expenses ALTER COLUMN txn_date SET NOT NULL")
+            cur.execute("""
+                SELECT DISTINCT date_trunc('month', txn_date)::date
+                FROM expenses_unpartitioned
+                WHERE txn_date IS NOT NULL
+            """)
+            for (month_start,) in cur.fetchall():
+                create_month_partition(cur, month_start)
+            cur.execute("CREATE TABLE expenses_default PARTITION OF expenses DEFAULT")
+
+            cur.execute("INSERT INTO expenses SELECT * FROM expenses_unpartitioned")
+            cur.execute("DROP TABLE expenses_unpartitioned")
+
+            cur.execute("CREATE UNIQUE INDEX expenses_hashcode_key ON expenses (hashcode, txn_date)")
+            for number, _, statements in MIGRATIONS:
+                if number < 3:
+                    continue
+                for statement in statements:
+                    if statement.startswith("CREATE INDEX"):
+                        cur.execute(statement)
+    pg_utils._partitioned = None
+    print("expenses converted to monthly partitions")
+    return True
+
+
+if __name__ == "__main__":
+    if "--partition" in sys.argv:
+        partition_expenses()
+    elif "--rebuild-rollups" in sys.argv:
+        pg_utils.rebuild_rollups()
+        print("rollups rebuilt")
+    else:
+        apply_migrations()
@@ -1,41 +1,116 @@
+import atexit
 import json
+from collections import Counter, OrderedDict
 import os
 import re
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-from langchain.output_parsers import StructuredOutputParser, ResponseSchema
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from keyword_matcher import KeywordMatcher
+from merchants import add_merchants
 load_dotenv()
 
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory lock, writes are still atomic
+    fcntl = None
+
+CATEGORIES = "Food, Person, Petrol, Grocery, Clothing, Salon, Hospital, Sports, Others"
+
+# Unknown merchants are sent to the LLM this many per prompt,
+# with at most LLM_MAX_CONCURRENCY prompts in flight
+LLM_BATCH_SIZE = 25
+LLM_MAX_CONCURRENCY = 4
+
+# Nearest-neighbour tier (merchant_index) between rules and the LLM; CATEGORIZER_NEIGHBOURS=0 turns it off
+USE_NEIGHBOURS = os.getenv("CATEGORIZER_NEIGHBOURS", "1") != "0"
+
+# Merchants remembered across runs (LRU); 0 keeps only the per-run dedup
+MEMO_SIZE = 4096
+
 class ExpenseCategorizer:
 
-    def __init__(self, rules_file="rules.json"):
+    def __init__(self, rules_file="rules.json", use_neighbours=USE_NEIGHBOURS, memo_size=MEMO_SIZE):
         self.rules_file = rules_file
+        self.use_neighbours = use_neighbours
+        self.memo_size = memo_size
+        # merchant -> category, most recently used last
+        self._memo = OrderedDict()
+        # memo_hits: rows answered without any tier (repeat in the run or in the LRU)
+        # memo_misses: distinct merchants resolved by rules / neighbours / llm
+        self.stats = Counter()
         self.rules = self.load_rules()
+        self._matcher = None
+        # Rules learned since the last flush: {category: [keywords]}
+        self._pending = {}
+        atexit.register(self.flush_rules)
 
-        # init LLM
-        self.llm = ChatOpenAI()
-
-        # Structured output parser
-        schema = [ResponseSchema(name="category", description="Predicted category")]
-        self.output_parser = StructuredOutputParser.from_response_schemas(schema)
-        self.format_instructions = self.output_parser.get_format_instructions()
-
-        # Build prompt
-        self.prompt = PromptTemplate(
-            template=(
-                "Classify the given merchant name into one of these categories:\n"
-                "Food, Person, Petrol, Grocery, Clothing, Salon, Hospital, Sports, Others.\n"
-                "Return ONLY the category name.\n\n"
-                "merchant: {text}\n\n"
-                "{format_instructions}"
-            ),
-            input_variables=["text"],
-            partial_variables={"format_instructions": self.format_instructions},
-        )
+        # LLM clients are built on first miss: rule-only runs never load them
+        self._lock = threading.Lock()
+        self._llm = None
+        self._chain = None
+        self._batch_chain = None
+        self._neighbours = None
+
+    # --------------------
+    #  LLM & Chains (lazy)
+    # --------------------
+    @property
+    def llm(self):
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    from llm_cache import chat_model
+                    # responses are cached across runs, see llm_cache
+                    self._llm = chat_model()
+        return self._llm
+
+    @property
+    def chain(self):
+        if self._chain is None:
+            from langchain_core.prompts import PromptTemplate
+            from langchain.output_parsers import StructuredOutputParser, ResponseSchema
+
+            # Structured output parser
+            schema = [ResponseSchema(name="category", description="Predicted category")]
+            output_parser = StructuredOutputParser.from_response_schemas(schema)
+
+            # Build prompt
+            prompt = PromptTemplate(
+                template=(
+                    "Classify the given merchant name into one of these categories:\n"
+                    f"{CATEGORIES}.\n"
+                    "Return ONLY the category name.\n\n"
+                    "merchant: {text}\n\n"
+                    "{format_instructions}"
+                ),
+                input_variables=["text"],
+                partial_variables={"format_instructions": output_parser.get_format_instructions()},
+            )
 
-        # Build chain
-        self.chain = self.prompt | self.llm | self.output_parser
+            # Build chain
+            self._chain = prompt | self.llm | output_parser
+        return self._chain
+
+    @property
+    def batch_chain(self):
+        if self._batch_chain is None:
+            from langchain_core.prompts import PromptTemplate
+            from langchain_core.output_parsers import JsonOutputParser
+
+            # Batch prompt: many merchants in, one JSON object {merchant: category} out
+            prompt = PromptTemplate(
+                template=(
+                    "Classify each merchant name below into one of these categories:\n"
+                    f"{CATEGORIES}.\n"
+                    "Return ONLY a JSON object mapping every merchant name, exactly as written, "
+                    "to its category name.\n\n"
+                    "merchants (one per line):\n{merchants}"
+                ),
+                input_variables=["merchants"],
+            )
+            self._batch_chain = prompt | self.llm | JsonOutputParser()
+        return self._batch_chain
 
     # --------------------
     #  Load & Save Rules
@@ -47,22 +122,110 @@ class ExpenseCategorizer:
         with open(self.rules_file, "r") as f:
             return json.load(f)
 
+    @contextmanager
+    def _rules_lock(self):
+        # Serialises read-merge-write across processes (cron run + dashboard upload)
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.rules_file}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
     def save_rules(self):
-        with open(self.rules_file, "w") as f:
-            json.dump(self.rules, f, indent=4)
+        """
+        Merge the rules learned since the last save into the file on disk and
+        replace it atomically. Re-reading under the lock keeps rules another
+        process learned meanwhile instead of overwriting them.
+        """
+        with self._rules_lock():
+            if os.path.exists(self.rules_file):
+                with open(self.rules_file, "r") as f:
+                    rules = json.load(f)
+            else:
+                rules = {category: list(keywords) for category, keywords in self.rules.items()}
+
+            for category, keywords in self._pending.items():
+                known = rules.setdefault(category, [])
+                known.extend(kw for kw in keywords if kw not in known)
+
+            tmp = f"{self.rules_file}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(rules, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.rules_file)
+
+        # Keywords this process learned plus any another process saved meanwhile
+        added = {
+            category: [kw for kw in keywords
+                       if kw not in self.rules.get(category, ()) or kw in self._pending.get(category, ())]
+            for category, keywords in rules.items()
+        }
+        self.rules = rules
+        self._pending = {}
+        self._matcher = None
+        self._forget_matching(added)
+
+    def _forget_matching(self, keywords):
+        """Drop memoised answers a new keyword could change; the rest of the LRU stays"""
+        keywords = {category: kws for category, kws in keywords.items() if kws}
+        if not keywords or not self._memo:
+            return
+        matcher = KeywordMatcher(keywords)
+        for merchant in [m for m in self._memo if matcher.match(m) is not None]:
+            del self._memo[merchant]
+
+    def flush_rules(self):
+        """Write learned rules, if any; called once per batch and at exit"""
+        if self._pending:
+            self.save_rules()
 
     # --------------------
     #  Rule-Based Matching
     # --------------------
+    @property
+    def matcher(self):
+        # Compiled lazily and dropped whenever the rules change
+        if self._matcher is None:
+            self._matcher = KeywordMatcher(self.rules)
+        return self._matcher
+
+    def add_rule(self, category, keyword):
+        """Learn a rule in memory; it reaches the rules file on the next flush_rules()"""
+        self.rules.setdefault(category, []).append(keyword)
+        self._pending.setdefault(category, []).append(keyword)
+        self._matcher = None
+
     def rule_based_category(self, merchant):
-        merchant_lower = merchant.lower()
+        return self.matcher.match(merchant)  # None if no rule matched
 
-        for category, keywords in self.rules.items():
-            for kw in keywords:
-                if kw.lower() in merchant_lower:
-                    return category
+    # ------------------------
+    #  Nearest-Neighbour Matching
+    # ------------------------
+    @property
+    def neighbours(self):
+        """MerchantIndex over rules + history, or None when disabled/unavailable"""
+        if not self.use_neighbours:
+            return None
+        if self._neighbours is None:
+            from merchant_index import MerchantIndex
+            try:
+                self._neighbours = MerchantIndex.from_sources(self.rules)
+            except Exception as e:
+                # No model/DB available: carry on with rules + LLM only
+                print(f"⚠️ Nearest-neighbour categoriser disabled: {e}")
+                self.use_neighbours = False
+                return None
+        return self._neighbours
 
-        return None  # no rule matched
+    def neighbour_categories(self, merchants):
+        """{merchant: category} for merchants close enough to a labelled one"""
+        index = self.neighbours
+        return index.classify_many(merchants) if index is not None else {}
 
     # ------------------------
     #  LLM Categorization
@@ -74,34 +237,165 @@ class ExpenseCategorizer:
         # Clean output
         return category.strip()
 
+    def llm_categorize_batch(self, merchants, batch_size=LLM_BATCH_SIZE, max_concurrency=LLM_MAX_CONCURRENCY):
+        """Classify many merchants in a few prompts -> {merchant: category}"""
+        merchants = list(dict.fromkeys(merchants))
+        chunks = [merchants[i:i + batch_size] for i in range(0, len(merchants), batch_size)]
+        results = self.batch_chain.batch(
+            [{"merchants": "\n".join(chunk)} for chunk in chunks],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+
+        categories = {}
+        for chunk, result in zip(chunks, results):
+            if not isinstance(result, dict):
+                continue  # failed or unparseable batch: handled below
+            answers = {str(k).strip().lower(): v for k, v in result.items()}
+            for merchant in chunk:
+                category = answers.get(merchant.lower())
+                if isinstance(category, str) and category.strip():
+                    categories[merchant] = category.strip()
+
+        # Whatever a batch dropped or garbled goes through the single-merchant prompt
+        for merchant in merchants:
+            if merchant not in categories:
+                categories[merchant] = self.llm_categorize(merchant)
+        return categories
+
+    def _remember(self, merchant, category):
+        if self.memo_size <= 0:
+            return
+        self._memo[merchant] = category
+        self._memo.move_to_end(merchant)
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+
+    def reset_stats(self):
+        self.stats.clear()
+
+    def categorize_many(self, merchants):
+        """
+        {merchant.strip(): category} for a whole run. Each distinct merchant is
+        categorised once: from the LRU memo, else rules, then nearest
+        neighbours, and whatever is left is batched to the LLM.
+        """
+        rows = [m.strip() for m in merchants]
+        distinct = list(dict.fromkeys(rows))
+        self.stats["rows"] += len(rows)
+        self.stats["memo_hits"] += len(rows) - len(distinct)
+
+        found = {}
+        misses = []
+        for merchant in distinct:
+            category = self._memo.get(merchant)
+            if category is not None:
+                self._memo.move_to_end(merchant)
+                self.stats["memo_hits"] += 1
+                found[merchant] = category
+                continue
+            self.stats["memo_misses"] += 1
+            category = self.rule_based_category(merchant)
+            if category:
+                self.stats["rule"] += 1
+                found[merchant] = category
+            else:
+                misses.append(merchant)
+
+        if misses:
+            near = self.neighbour_categories(misses)
+            self.stats["neighbour"] += len(near)
+            found.update(near)
+            misses = [m for m in misses if m not in near]
+
+        if misses:
+            learned = self.llm_categorize_batch(misses)
+            self.stats["llm"] += len(learned)
+            for merchant, category in learned.items():
+                self.add_rule(category, merchant.lower())
+                found[merchant] = category
+            self.flush_rules()
+            if self._neighbours is not None:
+                self._neighbours.add_many(learned)
+
+        for merchant, category in found.items():
+            self._remember(merchant, category)
+        return found
+
     # ------------------------
     #  Final Categorize Logic
     # ------------------------
     def categorize(self, merchant):
         merchant_clean = merchant.strip()
 
+        category = self._memo.get(merchant_clean)
+        if category is not None:
+            self._memo.move_to_end(merchant_clean)
+            self.stats["memo_hits"] += 1
+            return category
+        self.stats["memo_misses"] += 1
+
         # 1️⃣ Try rule-based
         category = self.rule_based_category(merchant_clean)
         if category:
+            self.stats["rule"] += 1
+            self._remember(merchant_clean, category)
+            return category
+
+        # 2️⃣ Try nearest labelled merchants
+        category = self.neighbour_categories([merchant_clean]).get(merchant_clean)
+        if category:
+            self.stats["neighbour"] += 1
+            self._remember(merchant_clean, category)
             return category
 
-        # 2️⃣ Fallback to LLM
+        # 3️⃣ Fallback to LLM
         category = self.llm_categorize(merchant_clean)
+        self.stats["llm"] += 1
 
-        # 3️⃣ Auto-learn: update rules
-        self.rules[category].append(merchant_clean.lower())
-        self.save_rules()
+        # 4️⃣ Auto-learn: update rules (written by flush_rules, once per batch)
+        self.add_rule(category, merchant_clean.lower())
+        if self._neighbours is not None:
+            self._neighbours.add_many({merchant_clean: category})
+        self._remember(merchant_clean, category)
 
         return category
-categorizer = ExpenseCategorizer()
+_categorizer = None
+_categorizer_lock = threading.Lock()
+
+
+def get_categorizer():
+    """Process-wide ExpenseCategorizer, built on first use"""
+    global _categorizer
+    if _categorizer is None:
+        with _categorizer_lock:
+            if _categorizer is None:
+                _categorizer = ExpenseCategorizer()
+    return _categorizer
+
+
+def merchant_name(mail):
+    """Canonical merchant when resolved (see merchants.add_merchants), else the raw payee"""
+    return mail.get('Merchant') or mail['Paid_to']
+
+
 def categorize(mails):
+    """
+    Set mail['Category'] on every mail. Run counters are printed once;
+    cumulative ones are in get_categorizer().stats.
+    """
+    categorizer = get_categorizer()
+    before = Counter(categorizer.stats)
+    mails = add_merchants(mails)
+    merchants = [merchant_name(mail) for mail in mails if mail['Paid_to']]
+    categories = categorizer.categorize_many(merchants)
     for mail in mails:
-        print("*"*80)
-        print(mail)
-        merchant_name = mail['Paid_to']
-        if merchant_name:
-            result = categorizer.categorize(merchant_name)
-            mail['Category'] = result
+        if mail['Paid_to']:
+            mail['Category'] = categories[merchant_name(mail).strip()]
         else :
             mail['Category'] = "SIP"
+
+    run = categorizer.stats - before
+    print(f"Categorised {len(mails)} mails: {run['memo_hits']} memo hits, "
+          f"{run['memo_misses']} lookups (rules {run['rule']}, neighbours {run['neighbour']}, llm {run['llm']})")
     return mails
\ No newline at end of file
@@ -7,9 +7,11 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from base64 import urlsafe_b64decode
-from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 import os
+from gmail_fetch import fetch_messages, GMAIL_BATCH_LIMIT
+from message_cache import get_default_cache
+from html_text import html_to_text
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly","https://www.googleapis.com/auth/gmail.send"]
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -92,6 +94,48 @@ def extract_full_html(payload):
 
     return ""
 
+def message_sender(msg_data):
+    """Value of the From header, or None when the resource has no headers"""
+    for h in msg_data.get("payload", {}).get("headers", []):
+        if h.get("name", "").lower() == "from":
+            return h.get("value")
+    return None
+
+# Bump when html_to_text output changes so cached texts are rebuilt from the cached payloads
+TEXT_VERSION = 3
+
+def messages_to_text(service, messages, keep=None, cache=None):
+    """
+    Fetch the listed messages concurrently and return (sender, cleaned text)
+    pairs, in order; the sender (From header) lets parse_alert pick the bank parser.
+    keep: optional predicate on the full message resource.
+    Messages already in the local cache are not downloaded again; messages
+    deleted since they were listed are skipped.
+    """
+    cache = cache or get_default_cache()
+    ids = [msg["id"] for msg in messages]
+
+    entries = {msg_id: cache.get(msg_id) for msg_id in ids}
+    missing = [msg_id for msg_id, entry in entries.items() if entry is None]
+    if missing:
+        for msg_id, msg_data in zip(missing, fetch_messages(service, missing)):
+            if msg_data is not None:
+                entries[msg_id] = {"message": msg_data, "text": None, "text_version": None}
+
+    result = []
+    for msg_id in ids:
+        entry = entries[msg_id]
+        if entry is None:
+            continue
+        if keep is not None and not keep(entry["message"]):
+            continue
+        if entry["text"] is None or entry["text_version"] != TEXT_VERSION:
+            entry["text"] = html_to_text(extract_full_html(entry["message"]["payload"]))
+            entry["text_version"] = TEXT_VERSION
+            cache.put(msg_id, entry["message"], entry["text"], TEXT_VERSION)
+        result.append((message_sender(entry["message"]), entry["text"]))
+    return result
+
 def fetch_emails_old(service):
     #query = 'from:alerts@hdfcbank.net'  # wide search to capture all HDFC debit emails
     # query = 'from:alerts@hdfcbank.bank.in'
@@ -106,25 +150,7 @@ def fetch_emails_old(service):
 
     messages = results.get("messages", [])
     print("Found", len(messages), "emails\n")
-    result = []
-    for msg in messages:
-        # Get full email data including all MIME parts
-        msg_data = service.users().messages().get(
-            userId="me",
-            id=msg["id"],
-            format="full"
-        ).execute()
-
-        payload = msg_data["payload"]
-        html = extract_full_html(payload)
-
-        soup = BeautifulSoup(html, "html.parser")
-        clean_text = soup.get_text(separator="\n")
-        lines = clean_text.split("\n")
-        lines = [line.strip() for line in lines if line.strip() != ""]
-        clean_text = "\n".join(lines)
-        result.append(clean_text)
-    return result
+    return messages_to_text(service, messages)
 
 def fetch_emails(service):
     today = datetime.now()
@@ -159,43 +185,26 @@ def fetch_emails(service):
 
     print(f"Total emails found for {gmail_today}: {len(all_messages)}")
 
-    result = []
-
-    for msg in all_messages:
-        msg_data = service.users().messages().get(
-            userId="me",
-            id=msg["id"],
-            format="full"
-        ).execute()
-
-        payload = msg_data["payload"]
-
-        html = extract_full_html(payload)
-        soup = BeautifulSoup(html, "html.parser")
-        clean_text = soup.get_text(separator="\n")
-
-        lines = clean_text.split("\n")
-        lines = [line.strip() for line in lines if line.strip() != ""]
-        clean_text = "\n".join(lines)
-
-        result.append(clean_text)
-
-    return result
+    return messages_to_text(service, all_messages)
 
 from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
 
 def fetch_emails_by_date(service, target_date):
     """
     target_date: string in 'YYYY-MM-DD' format
     Example: '2026-02-10'
     """
+    return messages_to_text(service, list_messages_by_date(service, target_date))
 
-    # Convert string date to datetime
+def list_messages_by_date(service, target_date):
+    """Message stubs ({"id", "threadId"}) of the alerts received on target_date"""
     date_obj = datetime.strptime(target_date, "%Y-%m-%d")
+    return list_messages_in_range(service, date_obj, date_obj + timedelta(days=1))
 
-    gmail_today = date_obj.strftime("%Y/%m/%d")
-    gmail_tomorrow = (date_obj + timedelta(days=1)).strftime("%Y/%m/%d")
+def list_messages_in_range(service, start, end, cache=None):
+    """Message stubs of the alerts received in [start, end) (datetimes, day granularity)"""
+    gmail_today = start.strftime("%Y/%m/%d")
+    gmail_tomorrow = end.strftime("%Y/%m/%d")
 
     # query = f'from:alerts@hdfcbank.net after:{gmail_today} before:{gmail_tomorrow}'
     query = (
@@ -204,46 +213,38 @@ def fetch_emails_by_date(service, target_date):
         f'after:{gmail_today} before:{gmail_tomorrow}'
     )
 
-    all_messages = []
-    print("All messages : ",all_messages)
-    next_page_token = None
-
-    while True:
-        results = service.users().messages().list(
-            userId="me",
-            q=query,
-            maxResults=50,
-            pageToken=next_page_token
-        ).execute()
-
-        messages = results.get("messages", [])
-        all_messages.extend(messages)
-
-        next_page_token = results.get("nextPageToken")
-        if not next_page_token:
-            break
+    # A window that closed (with a day of timezone margin) cannot gain new mail
+    cache = cache or get_default_cache()
+    window_closed = end + timedelta(days=1) <= datetime.now()
+    all_messages = cache.get_list(query) if window_closed else None
+    if all_messages is None:
+        all_messages = []
+        print("All messages : ",all_messages)
+        next_page_token = None
+
+        while True:
+            results = service.users().messages().list(
+                userId="me",
+                q=query,
+                maxResults=50,
+                pageToken=next_page_token
+            ).execute()
+
+            messages = results.get("messages", [])
+            all_messages.extend(messages)
+
+            next_page_token = results.get("nextPageToken")
+            if not next_page_token:
+                break
+
+        if window_closed:
+            cache.put_list(query, all_messages)
 
     print(f"Total emails found for {gmail_today}: {len(all_messages)}")
 
-    result = []
-
-    for msg in all_messages:
-        msg_data = service.users().messages().get(
-            userId="me",
-            id=msg["id"],
-            format="full"
-        ).execute()
-
-        payload = msg_data["payload"]
-
-        html = extract_full_html(payload)
-        soup = BeautifulSoup(html, "html.parser")
-        clean_text = soup.get_text(separator="\n")
+    return all_messages
 
-        lines = clean_text.split("\n")
-        lines = [line.strip() for line in lines if line.strip()]
-        clean_text = "\n".join(lines)
-
-        result.append(clean_text)
-
-    return result
+def iter_message_texts(service, messages, batch_size=GMAIL_BATCH_LIMIT, keep=None):
+    """Like messages_to_text, but fetches and yields one batch of (sender, text) pairs at a time"""
+    for i in range(0, len(messages), batch_size):
+        yield from messages_to_text(service, messages[i:i + batch_size], keep=keep)
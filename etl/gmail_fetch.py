@@ -0,0 +1,165 @@
+"""
+Concurrent Gmail message fetching.
+
+fetch_messages() downloads many messages with either
+  - "batch"  : Gmail's batch HTTP endpoint, up to GMAIL_BATCH_LIMIT gets per round trip
+  - "threads": a bounded thread pool of single gets
+and retries rate-limited requests with exponential backoff. A message that
+no longer exists (HTTP 404, e.g. a draft replaced since it was listed) is
+skipped rather than failing the whole fetch.
+
+Only the discovery-client surface is used (users().messages().get,
+new_batch_http_request), so a local fake service works the same way.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Gmail accepts 100 calls per batch but starts rate limiting above ~50
+GMAIL_BATCH_LIMIT = 50
+DEFAULT_WORKERS = 8
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 32.0
+
+RETRYABLE_STATUS = {429, 500, 503}
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+
+def is_retryable(error):
+    """HttpError-like errors worth retrying: 429/5xx and 403 rate limits"""
+    resp = getattr(error, "resp", None)
+    status = getattr(resp, "status", None)
+    if status is None:
+        return False
+    status = int(status)
+    if status in RETRYABLE_STATUS:
+        return True
+    if status == 403:
+        content = getattr(error, "content", b"") or b""
+        if isinstance(content, bytes):
+            content = content.decode(errors="ignore")
+        return any(reason in content for reason in RATE_LIMIT_REASONS)
+    return False
+
+
+def is_not_found(error):
+    resp = getattr(error, "resp", None)
+    status = getattr(resp, "status", None)
+    return status is not None and int(status) == 404
+
+
+def backoff_delay(attempt):
+    return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)) + random.uniform(0, 1)
+
+
+def _get_request(service, msg_id, fmt):
+    return service.users().messages().get(userId="me", id=msg_id, format=fmt)
+
+
+def _fetch_batch_mode(service, ids, fmt, batch_size, max_retries, sleep):
+    results = {}
+    batch_size = min(batch_size, GMAIL_BATCH_LIMIT)
+
+    for i in range(0, len(ids), batch_size):
+        pending = ids[i:i + batch_size]
+        attempt = 0
+        while pending:
+            retry = []
+            failures = []
+
+            def callback(request_id, response, exception):
+                if exception is None:
+                    results[request_id] = response
+                elif is_not_found(exception):
+                    results[request_id] = None
+                elif is_retryable(exception):
+                    retry.append(request_id)
+                else:
+                    failures.append(exception)
+
+            batch = service.new_batch_http_request(callback=callback)
+            for msg_id in pending:
+                batch.add(_get_request(service, msg_id, fmt), request_id=msg_id)
+            try:
+                batch.execute()
+            except Exception as e:
+                # The batch request itself was throttled: resend whatever is not in yet
+                if not is_retryable(e):
+                    raise
+                retry = [msg_id for msg_id in pending if msg_id not in results]
+
+            if failures:
+                raise failures[0]
+            if retry and attempt >= max_retries:
+                raise RuntimeError(f"Gmail rate limit: {len(retry)} messages still failing after {max_retries} retries")
+            if retry:
+                sleep(backoff_delay(attempt))
+                attempt += 1
+            pending = retry
+
+    return results
+
+
+def _fetch_thread_mode(service, ids, fmt, workers, max_retries, sleep, service_factory):
+    # googleapiclient services share one httplib2 connection and are not
+    # thread-safe, so each worker builds its own via service_factory.
+    # Without a factory (batch fallback only) the one service is used from a single worker.
+    if service_factory is None:
+        workers = 1
+    local = threading.local()
+
+    def worker_service():
+        if service_factory is None:
+            return service
+        if not hasattr(local, "service"):
+            local.service = service_factory()
+        return local.service
+
+    def fetch_one(msg_id):
+        attempt = 0
+        while True:
+            try:
+                return msg_id, _get_request(worker_service(), msg_id, fmt).execute()
+            except Exception as e:
+                if is_not_found(e):
+                    return msg_id, None
+                if not is_retryable(e) or attempt >= max_retries:
+                    raise
+                sleep(backoff_delay(attempt))
+                attempt += 1
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(fetch_one, ids))
+
+
+def fetch_messages(service, message_ids, fmt="full", mode="batch",
+                   batch_size=GMAIL_BATCH_LIMIT, workers=DEFAULT_WORKERS,
+                   max_retries=MAX_RETRIES, service_factory=None, sleep=time.sleep):
+    """
+    Fetch full message resources for message_ids.
+    Returns the messages in the same order as message_ids, with None in place
+    of any message Gmail no longer has (404).
+
+    mode="batch" needs service.new_batch_http_request; otherwise the messages are
+    fetched one at a time on service.
+    mode="threads" requires service_factory, a zero-arg callable building one
+    service per worker thread (a single service is not thread-safe).
+    """
+    if mode == "threads" and service_factory is None:
+        raise ValueError("mode=\"threads\" needs a service_factory: one Gmail service per worker")
+    ids = list(dict.fromkeys(message_ids))
+    if not ids:
+        return []
+
+    if mode == "batch" and hasattr(service, "new_batch_http_request"):
+        results = _fetch_batch_mode(service, ids, fmt, batch_size, max_retries, sleep)
+    else:
+        results = _fetch_thread_mode(service, ids, fmt, workers, max_retries, sleep, service_factory)
+
+    missing = sum(1 for msg_id in ids if results[msg_id] is None)
+    if missing:
+        print(f"⚠️ Skipped {missing} messages deleted since they were listed")
+    return [results[msg_id] for msg_id in message_ids]
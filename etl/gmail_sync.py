@@ -0,0 +1,155 @@
+"""
+Incremental Gmail sync driven by the mailbox historyId.
+
+After each successful run the caller persists the historyId returned by
+sync_emails(); the next run asks users.history.list only for messages added
+since then (INBOX only, so drafts and sent mail are not listed). If there is no stored historyId, or Gmail reports it expired
+(HTTP 404), a windowed full sync from the last sync date is done instead.
+
+history.list returns every added message, not just alerts, so those are
+first fetched as headers only (format="metadata") and filtered on sender;
+only the bank alerts are then downloaded in full.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+from extract_emails import messages_to_text, message_sender
+from gmail_fetch import fetch_messages
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SYNC_STATE_PATH = os.path.join(BASE_DIR, "gmail_sync_state.json")
+
+BANK_SENDER = "hdfcbank"
+ALERT_QUERY = f'from:{BANK_SENDER} (debit OR spent OR transaction OR "Rs." OR "INR")'
+# Full-sync window when nothing has been synced yet
+DEFAULT_WINDOW_DAYS = 1
+
+
+def load_sync_state(path=SYNC_STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_sync_state(history_id, path=SYNC_STATE_PATH):
+    """Call only after the fetched mails were stored, so a failed run is retried"""
+    state = {"historyId": str(history_id), "last_sync": datetime.now().strftime("%Y-%m-%d")}
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp, path)
+
+
+def is_bank_alert(msg_data):
+    sender = message_sender(msg_data)
+    if sender is None:
+        # No headers (e.g. minimal fakes): let the parser decide
+        return True
+    return BANK_SENDER in sender.lower()
+
+
+def filter_bank_alerts(service, messages):
+    """Keep the stubs whose From header is the bank, fetching headers only"""
+    if not messages:
+        return []
+    headers = fetch_messages(service, [msg["id"] for msg in messages], fmt="metadata")
+    # meta is None for messages deleted since the history event
+    return [msg for msg, meta in zip(messages, headers) if meta is not None and is_bank_alert(meta)]
+
+
+def _is_expired_history(error):
+    resp = getattr(error, "resp", None)
+    return getattr(resp, "status", None) is not None and int(resp.status) == 404
+
+
+def list_added_messages(service, start_history_id):
+    """Messages added since start_history_id. Returns (messages, latest_history_id)."""
+    messages = {}
+    latest = start_history_id
+    next_page_token = None
+
+    while True:
+        results = service.users().history().list(
+            userId="me",
+            startHistoryId=start_history_id,
+            historyTypes=["messageAdded"],
+            labelId="INBOX",
+            pageToken=next_page_token
+        ).execute()
+
+        for record in results.get("history", []):
+            for added in record.get("messagesAdded", []):
+                msg = added["message"]
+                messages[msg["id"]] = msg
+        latest = results.get("historyId", latest)
+
+        next_page_token = results.get("nextPageToken")
+        if not next_page_token:
+            break
+
+    return list(messages.values()), latest
+
+
+def list_window_messages(service, since):
+    """Windowed full sync: every alert from the day before `since` onwards"""
+    gmail_after = (since - timedelta(days=1)).strftime("%Y/%m/%d")
+    query = f"{ALERT_QUERY} after:{gmail_after}"
+
+    all_messages = []
+    next_page_token = None
+    while True:
+        results = service.users().messages().list(
+            userId="me",
+            q=query,
+            maxResults=500,
+            pageToken=next_page_token
+        ).execute()
+        all_messages.extend(results.get("messages", []))
+
+        next_page_token = results.get("nextPageToken")
+        if not next_page_token:
+            break
+    return all_messages
+
+
+def sync_messages(service, state_path=SYNC_STATE_PATH):
+    """
+    Bank alert stubs to process this run. Returns (messages, history_id).
+    Persist history_id with save_sync_state once they have been processed.
+    """
+    state = load_sync_state(state_path)
+    start_history_id = state.get("historyId")
+
+    if start_history_id:
+        try:
+            messages, history_id = list_added_messages(service, start_history_id)
+        except Exception as e:
+            if not _is_expired_history(e):
+                raise
+            print("⚠️ Stored historyId expired, falling back to full sync")
+        else:
+            messages = filter_bank_alerts(service, messages)
+            print(f"Total emails found for {datetime.now().strftime('%Y/%m/%d')}: {len(messages)}")
+            return messages, history_id
+
+    # Take the marker before listing so nothing arriving mid-sync is skipped
+    history_id = service.users().getProfile(userId="me").execute()["historyId"]
+    if state.get("last_sync"):
+        since = datetime.strptime(state["last_sync"], "%Y-%m-%d")
+    else:
+        since = datetime.now() - timedelta(days=DEFAULT_WINDOW_DAYS - 1)
+    messages = list_window_messages(service, since)
+    print(f"Full sync from {since.strftime('%Y/%m/%d')}")
+    print(f"Total emails found for {datetime.now().strftime('%Y/%m/%d')}: {len(messages)}")
+    return messages, history_id
+
+
+def sync_emails(service, state_path=SYNC_STATE_PATH):
+    """
+    Returns ([(sender, mail_text)], history_id). Persist history_id with save_sync_state
+    once the texts have been processed.
+    """
+    messages, history_id = sync_messages(service, state_path)
+    return messages_to_text(service, messages, keep=is_bank_alert), history_id
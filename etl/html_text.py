@@ -0,0 +1,124 @@
+"""
+HTML -> text extraction for bank alert emails.
+
+Two interchangeable extractors, both returning the non-empty, stripped lines
+of the document text joined by "\n":
+  - "bs4" : BeautifulSoup(html, "html.parser").get_text(separator="\n")
+  - "fast": a single-pass stdlib HTMLParser that only collects text runs,
+            without building a tree. Same output as "bs4", named entities
+            included (unknown or unterminated names are kept literally).
+            One known difference: numeric references to control
+            characters ("&#1;") are dropped, as html.unescape does, where
+            bs4 keeps the raw character.
+html_to_text() uses TEXT_EXTRACTOR; set_text_extractor() switches it.
+"""
+
+from html import unescape
+from html.entities import html5
+from html.parser import HTMLParser
+
+# Text inside these is not part of get_text() output in BeautifulSoup
+SKIP_TAGS = {"script", "style", "template"}
+
+# Entity name (without ";") -> text, the table BeautifulSoup resolves names with
+NAMED_ENTITIES = {name.rstrip(";"): text for name, text in html5.items()}
+
+
+class _TextCollector(HTMLParser):
+    """
+    Mirrors how BeautifulSoup's html.parser builder splits text into strings:
+    data is buffered and only flushed when markup (tag, comment, declaration)
+    interrupts it, so a stray '<' or an entity does not start a new string.
+    References are resolved the way BeautifulSoup does, not by html.unescape:
+    an unknown name stays as "&name" (so "&foo;" -> "&foo") and a name is
+    only matched whole (so "&ampx" stays "&ampx").
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.strings = []
+        self.buffer = []
+        self.skip_depth = 0
+
+    def flush(self):
+        if self.buffer:
+            if not self.skip_depth:
+                self.strings.append("".join(self.buffer))
+            self.buffer = []
+
+    def handle_starttag(self, tag, attrs):
+        self.flush()
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.flush()
+
+    def handle_endtag(self, tag):
+        self.flush()
+        if tag in SKIP_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def handle_data(self, data):
+        self.buffer.append(data)
+
+    def handle_entityref(self, name):
+        self.buffer.append(NAMED_ENTITIES.get(name, "&" + name))
+
+    def handle_charref(self, name):
+        self.buffer.append(unescape(f"&#{name};"))
+
+    def handle_comment(self, data):
+        self.flush()
+
+    def handle_decl(self, decl):
+        self.flush()
+
+    def handle_pi(self, data):
+        self.flush()
+
+    def unknown_decl(self, data):
+        self.flush()
+        # <![CDATA[...]]> is kept as text by BeautifulSoup
+        if data.startswith("CDATA["):
+            self.buffer.append(data[len("CDATA["):])
+            self.flush()
+
+
+def _clean_lines(text):
+    lines = text.split("\n")
+    lines = [line.strip() for line in lines if line.strip()]
+    return "\n".join(lines)
+
+
+def fast_html_to_text(html):
+    parser = _TextCollector()
+    parser.feed(html)
+    parser.close()
+    parser.flush()
+    return _clean_lines("\n".join(parser.strings))
+
+
+def bs4_html_to_text(html):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    return _clean_lines(soup.get_text(separator="\n"))
+
+
+EXTRACTORS = {
+    "fast": fast_html_to_text,
+    "bs4": bs4_html_to_text,
+}
+TEXT_EXTRACTOR = "fast"
+
+
+def set_text_extractor(name):
+    global TEXT_EXTRACTOR
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown text extractor: {name}")
+    TEXT_EXTRACTOR = name
+
+
+def html_to_text(html):
+    return EXTRACTORS[TEXT_EXTRACTOR](html)
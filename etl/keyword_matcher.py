@@ -0,0 +1,73 @@
+"""
+Aho-Corasick multi-keyword matcher for rule-based categorisation.
+
+Built once from {category: [keywords]}; match() walks the merchant name a
+single time, so its cost depends on the merchant length, not on the
+number of rules. When several categories match, the one listed first in
+the rules wins, which is what the old nested loop returned.
+"""
+
+from collections import deque
+
+
+class KeywordMatcher:
+
+    def __init__(self, rules):
+        self.categories = list(rules)
+        self.goto = [{}]
+        self.fail = [0]
+        # best[node]: lowest category index among keywords ending here (or via fail links)
+        self.best = [None]
+
+        for priority, category in enumerate(self.categories):
+            for kw in rules[category]:
+                self._add(kw.lower(), priority)
+        self._link()
+
+    def _add(self, keyword, priority):
+        node = 0
+        for ch in keyword:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.best.append(None)
+            node = nxt
+        if self.best[node] is None or priority < self.best[node]:
+            self.best[node] = priority
+
+    def _link(self):
+        queue = deque()
+        for nxt in self.goto[0].values():
+            queue.append(nxt)
+
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+            f_best = self.best[self.fail[node]]
+            if f_best is not None and (self.best[node] is None or f_best < self.best[node]):
+                self.best[node] = f_best
+
+    def match(self, text):
+        """First-listed category with a keyword contained in text, else None"""
+        goto, fail, best = self.goto, self.fail, self.best
+        found = best[0]   # an empty keyword matches everything
+        node = 0
+        for ch in text.lower():
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            b = best[node]
+            if b is not None and (found is None or b < found):
+                found = b
+                if found == 0:
+                    break
+        return None if found is None else self.categories[found]
@@ -0,0 +1,102 @@
+"""
+Nearest-neighbour merchant categoriser (the tier between rules and the LLM).
+
+Merchant names with a known category - the keywords in rules.json and the
+payees already in expenses - are embedded once with the same
+all-MiniLM-L6-v2 model the RAG side uses and kept as a normalised matrix
+in memory. An unknown merchant is embedded and compared to every label
+with one matrix product; its k nearest labels above the similarity
+threshold vote, weighted by similarity. Below the threshold the merchant
+is left to the LLM.
+
+    index = MerchantIndex.from_sources(rules)
+    index.classify_many(["pkbiryani house"])   # {"pkbiryani house": "Food"}
+"""
+
+import numpy as np
+
+NEIGHBOURS = 5
+SIMILARITY_THRESHOLD = 0.80
+
+
+def _normalise(name):
+    return " ".join(name.lower().split())
+
+
+class MerchantIndex:
+
+    def __init__(self, labels, model, k=NEIGHBOURS, threshold=SIMILARITY_THRESHOLD):
+        """labels: {merchant_name: category}; model: a SentenceTransformer"""
+        self.model = model
+        self.k = k
+        self.threshold = threshold
+        labels = {_normalise(name): category for name, category in labels.items() if name.strip()}
+        self.names = list(labels)
+        self.categories = [labels[name] for name in self.names]
+        self.vectors = self._encode(self.names)
+
+    @classmethod
+    def from_sources(cls, rules, history=None, model=None, **kwargs):
+        """
+        Labels from rules ({category: [keywords]}) and history ([(paid_to, category)],
+        read from the expenses table when not given). Rules win on conflicts.
+        """
+        if history is None:
+            from pg_utils import get_labelled_merchants
+            history = get_labelled_merchants()
+        if model is None:
+            from rag_utlis import get_embedding_model
+            model = get_embedding_model()
+
+        labels = {name: category for name, category in history if name and category}
+        for category, keywords in rules.items():
+            for keyword in keywords:
+                labels[keyword] = category
+        return cls(labels, model, **kwargs)
+
+    def _encode(self, names):
+        if not names:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.asarray(
+            self.model.encode(names, batch_size=256, normalize_embeddings=True),
+            dtype=np.float32,
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    def add_many(self, labels):
+        """Labels learned at run time (e.g. LLM answers): {merchant_name: category}"""
+        labels = {_normalise(name): category for name, category in labels.items() if name.strip()}
+        if not labels:
+            return
+        names = list(labels)
+        vectors = self._encode(names)
+        self.vectors = vectors if not self.names else np.vstack([self.vectors, vectors])
+        self.names.extend(names)
+        self.categories.extend(labels[name] for name in names)
+
+    def classify_many(self, merchants):
+        """{merchant: category} for the merchants with confident neighbours; the rest are omitted"""
+        merchants = list(dict.fromkeys(merchants))
+        if not merchants or not self.names:
+            return {}
+
+        # (queries x labels) cosine similarities: vectors are unit length
+        sims = self._encode([_normalise(m) for m in merchants]) @ self.vectors.T
+        k = min(self.k, len(self.names))
+        nearest = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+
+        found = {}
+        for merchant, row, idx in zip(merchants, sims, nearest):
+            votes = {}
+            for i in idx:
+                if row[i] >= self.threshold:
+                    category = self.categories[i]
+                    votes[category] = votes.get(category, 0.0) + float(row[i])
+            if votes:
+                found[merchant] = max(votes, key=votes.get)
+        return found
+
+    def classify(self, merchant):
+        return self.classify_many([merchant]).get(merchant)
@@ -0,0 +1,203 @@
+"""
+Canonical merchants: map every payee variant to one merchant_id at ingest.
+
+    "newkailashfoods bh", "new kailash foods bhuinj", "NEW KAILASH FOODS"
+        -> merchant_key "newkailashfoodsbhuinj" ... -> one merchant_id
+
+Normalisation (merchant_key): lowercase, drop UPI handles, punctuation and
+noise tokens (pvt, ltd, mr, ...), then join the tokens, so spacing
+differences disappear. An unseen key is matched fuzzily, but only against
+the merchants in its block (same first BLOCK_PREFIX characters), so the
+cost per name does not grow with the number of merchants:
+  - a prefix variant (one key a prefix of the other, >= MIN_PREFIX chars),
+    only if the extra part is a known location token or the two are still
+    similar (>= PREFIX_THRESHOLD), so "rajeshkumar" and "rajeshkumarsingh"
+    stay two people
+  - or difflib similarity >= FUZZY_THRESHOLD
+Raw strings already seen are resolved by a dict lookup.
+
+The tables live in Postgres (pg_utils.MERCHANT_DDL, applied by schema
+migration 6: run python db/schema.py first); new merchants and
+aliases are written once per resolve_many() call.
+
+Run:  python merchants.py     (assign merchant_id to existing rows)
+"""
+
+import re
+import threading
+from difflib import SequenceMatcher
+
+BLOCK_PREFIX = 4
+MIN_PREFIX = 8
+# Prefix variants need less similarity than other variants, but enough that a
+# surname (5+ characters on a short personal name) is not taken for truncation
+PREFIX_THRESHOLD = 0.85
+FUZZY_THRESHOLD = 0.9
+
+NOISE_TOKENS = {
+    "pvt", "private", "ltd", "limited", "llp", "inc", "co", "company", "corp",
+    "india", "the", "and", "mr", "mrs", "ms", "dr", "shri", "smt", "upi",
+}
+# Place names that banks append to the payee; a prefix variant differing only
+# by one of these is the same merchant. Extend as new ones show up.
+LOCATION_TOKENS = {
+    "bhuinj", "satara", "wai", "pune", "mumbai", "thane", "navimumbai", "nashik",
+    "kolhapur", "sangli", "nagpur", "aurangabad", "delhi", "newdelhi", "bangalore",
+    "bengaluru", "hyderabad", "chennai", "kolkata", "ahmedabad", "surat", "jaipur",
+    "goa", "maharashtra", "mh", "in",
+}
+HANDLE_RE = re.compile(r"\S*@\S*")
+NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+def merchant_key(name):
+    """Normalised merchant key ('' for names with nothing usable)"""
+    if not name:
+        return ""
+    text = HANDLE_RE.sub(" ", name.lower())
+    tokens = [t for t in NON_ALNUM_RE.split(text) if t and t not in NOISE_TOKENS]
+    return "".join(tokens)
+
+
+class MerchantResolver:
+
+    def __init__(self, aliases=()):
+        """aliases: [(alias, merchant_id, canonical_name, merchant_key)] (pg_utils.get_merchant_aliases)"""
+        self.lock = threading.Lock()
+        self.by_alias = {}     # raw paid_to -> merchant_id
+        self.by_key = {}       # merchant_key -> merchant_id
+        self.names = {}        # merchant_id -> canonical_name
+        self.blocks = {}       # key prefix -> [merchant_key]
+        for alias, merchant_id, name, key in aliases:
+            self.by_alias[alias] = merchant_id
+            self._remember(key, merchant_id, name)
+
+    @classmethod
+    def from_db(cls):
+        from pg_utils import get_merchant_aliases
+        return cls(get_merchant_aliases())
+
+    def _remember(self, key, merchant_id, name):
+        if key not in self.by_key:
+            self.blocks.setdefault(key[:BLOCK_PREFIX], []).append(key)
+        self.by_key[key] = merchant_id
+        self.names.setdefault(merchant_id, name)
+
+    def _fuzzy(self, key):
+        """Known merchant_key closest to key within its block, or None"""
+        best, best_score = None, FUZZY_THRESHOLD
+        for candidate in self.blocks.get(key[:BLOCK_PREFIX], ()):
+            short, long_ = sorted((key, candidate), key=len)
+            score = SequenceMatcher(None, key, candidate).ratio()
+            if len(short) >= MIN_PREFIX and long_.startswith(short):
+                if long_[len(short):] in LOCATION_TOKENS or score >= PREFIX_THRESHOLD:
+                    return candidate
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    def resolve_many(self, names, save=None):
+        """
+        {name: (merchant_id, canonical_name)} for every name with a usable key.
+        save(merchants, aliases) persists new rows and returns
+        {merchant_key: (merchant_id, canonical_name)}; defaults to pg_utils.save_merchants.
+        """
+        if save is None:
+            from pg_utils import save_merchants as save
+
+        with self.lock:
+            ids = {}               # name -> merchant_id (alias already known)
+            keys = {}              # name -> merchant_key (alias recorded now)
+            new_merchants = {}     # merchant_key -> canonical name (first variant seen)
+            for name in dict.fromkeys(n for n in names if n):
+                if name in self.by_alias:
+                    ids[name] = self.by_alias[name]
+                    continue
+                key = merchant_key(name)
+                if not key:
+                    continue
+                known = key if key in self.by_key else self._fuzzy(key)
+                if known is None:
+                    # New merchant; later names in this batch can already match it
+                    known = key
+                    new_merchants[key] = name.strip()
+                    self._remember(key, None, name.strip())
+                keys[name] = known
+
+            if keys:
+                try:
+                    saved = save(list(new_merchants.items()), [(n, k) for n, k in keys.items()])
+                except Exception:
+                    self._forget(new_merchants)
+                    raise
+                for key, (merchant_id, canonical) in saved.items():
+                    self.by_key[key] = merchant_id
+                    self.names[merchant_id] = canonical
+                self._forget(k for k in new_merchants if self.by_key.get(k) is None)
+                self.names.pop(None, None)
+                for name, key in keys.items():
+                    merchant_id = self.by_key.get(key)
+                    if merchant_id is not None:
+                        self.by_alias[name] = ids[name] = merchant_id
+
+            return {name: (merchant_id, self.names[merchant_id]) for name, merchant_id in ids.items()}
+
+    def _forget(self, keys):
+        # Drop provisional merchants that never made it to the database
+        for key in list(keys):
+            if self.by_key.get(key) is None:
+                self.by_key.pop(key, None)
+                block = self.blocks.get(key[:BLOCK_PREFIX], [])
+                if key in block:
+                    block.remove(key)
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    """Process-wide resolver, loaded from the database on first use"""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = MerchantResolver.from_db()
+    return _resolver
+
+
+def add_merchants(records):
+    """
+    Set record["merchant_id"] and record["Merchant"] (canonical name) from
+    record["Paid_to"]. Paid_to itself is left as is, so hashcodes do not change.
+    Records are left unresolved if the database is unavailable.
+    """
+    records = list(records)
+    try:
+        resolved = get_resolver().resolve_many(r["Paid_to"] for r in records if r["Paid_to"])
+    except Exception as e:
+        print("⚠️ Merchant resolution skipped:", e)
+        return records
+    for record in records:
+        match = resolved.get(record["Paid_to"])
+        if match:
+            record["merchant_id"], record["Merchant"] = match
+    return records
+
+
+def assign_existing_rows(batch_size=1000):
+    """Backfill expenses.merchant_id for rows inserted before merchants existed"""
+    from pg_utils import get_unassigned_payees, set_merchant_ids
+
+    payees = get_unassigned_payees()
+    resolver = get_resolver()
+    assigned = 0
+    for i in range(0, len(payees), batch_size):
+        resolved = resolver.resolve_many(payees[i:i + batch_size])
+        set_merchant_ids([(name, merchant_id) for name, (merchant_id, _) in resolved.items()])
+        assigned += len(resolved)
+    print(f"✅ {assigned} payees linked to {len(set(resolver.by_key.values()))} merchants")
+
+
+if __name__ == "__main__":
+    assign_existing_rows()
@@ -0,0 +1,128 @@
+"""
+On-disk cache of raw Gmail messages and their cleaned text.
+
+Entries are keyed by Gmail message id (ids are immutable, so an id always
+maps to the same content) and stored gzip-compressed as
+    <cache_dir>/<id[:2]>/<id>.json.gz  ->  {"message": {...}, "text": "...", "text_version": N}
+List results for date windows that are fully in the past are cached too,
+so reprocessing old mail after a parser change needs no network calls.
+When the cache grows past max_bytes the least recently used entries are
+evicted (file mtime is bumped on every hit).
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "gmail_cache")
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+
+class MessageCache:
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self._entries())
+
+    # --------------------
+    #  Paths & IO
+    # --------------------
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json.gz")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json.gz"):
+                    path = os.path.join(root, name)
+                    st = os.stat(path)
+                    yield path, st.st_size, st.st_mtime
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def _write(self, key, entry):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(entry, f)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp, path)
+        with self.lock:
+            self.total_bytes += os.path.getsize(path) - old_size
+            over = self.total_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache is back under 90% of max_bytes"""
+        with self.lock:
+            target = int(self.max_bytes * 0.9)
+            for path, size, _ in sorted(self._entries(), key=lambda e: e[2]):
+                if self.total_bytes <= target:
+                    break
+                try:
+                    os.remove(path)
+                    self.total_bytes -= size
+                except OSError:
+                    pass
+
+    # --------------------
+    #  Messages
+    # --------------------
+    def get(self, msg_id):
+        return self._read(msg_id)
+
+    def put(self, msg_id, message, text=None, text_version=None):
+        self._write(msg_id, {"message": message, "text": text, "text_version": text_version})
+
+    def iter_messages(self):
+        """Every cached message resource (used for offline reprocessing/benchmarks)"""
+        for path, _, _ in list(self._entries()):
+            key = os.path.basename(path)[:-len(".json.gz")]
+            entry = self._read(key)
+            if entry and "message" in entry:
+                yield entry["message"]
+
+    # --------------------
+    #  List results
+    # --------------------
+    @staticmethod
+    def _query_key(query):
+        return "q" + hashlib.sha256(query.encode()).hexdigest()
+
+    def get_list(self, query):
+        entry = self._read(self._query_key(query))
+        return entry["messages"] if entry else None
+
+    def put_list(self, query, messages):
+        self._write(self._query_key(query), {"messages": messages})
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = MessageCache()
+    return _default_cache
@@ -0,0 +1,122 @@
+"""
+Registry of bank-specific parsers.
+
+Each bank/template registers a parser together with a cheap fingerprint:
+  - senders : sender domains (alerts), looked up in a dict
+  - markers : strings that identify the template in the document text;
+              all markers of a registry are compiled into one pattern, so
+              detection is a single scan whatever the number of banks
+Dispatch never tries parsers one after another: the fingerprint picks one,
+and the registry default is used when nothing matches.
+
+    ALERT_PARSERS.register("hdfc", parse_hdfc_text, senders=["hdfcbank.net"], markers=["HDFC Bank"], default=True)
+    parse_alert(text, sender="alerts@hdfcbank.net")
+"""
+
+import importlib
+import re
+import threading
+
+
+class ParserRegistry:
+
+    def __init__(self, kind, builtin_modules=()):
+        self.kind = kind
+        self.builtin_modules = builtin_modules
+        self.parsers = {}
+        self.by_sender = {}
+        self.by_marker = {}
+        self.default = None
+        self._marker_re = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def register(self, name, parser, senders=(), markers=(), default=False):
+        self.parsers[name] = parser
+        for domain in senders:
+            self.by_sender[domain.lower()] = name
+        for marker in markers:
+            self.by_marker[marker.lower()] = name
+        if default or self.default is None:
+            self.default = name
+        self._marker_re = None
+        return parser
+
+    def _load_builtins(self):
+        # Bank modules register themselves on import; import them lazily so the
+        # registry itself stays cheap and free of circular imports.
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                for module in self.builtin_modules:
+                    importlib.import_module(module)
+                self._loaded = True
+
+    def _markers(self):
+        if self._marker_re is None and self.by_marker:
+            # Longest first so a specific marker wins over its prefix
+            markers = sorted(self.by_marker, key=len, reverse=True)
+            self._marker_re = re.compile("|".join(re.escape(m) for m in markers), re.IGNORECASE)
+        return self._marker_re
+
+    def _sender_domain(self, sender):
+        sender = sender.lower().strip().rstrip(">")
+        domain = sender.rsplit("@", 1)[-1]
+        # alerts.hdfcbank.net -> hdfcbank.net -> net
+        labels = domain.split(".")
+        for i in range(len(labels) - 1):
+            name = self.by_sender.get(".".join(labels[i:]))
+            if name:
+                return name
+        return None
+
+    def detect(self, text, sender=None):
+        """Name of the parser for this document"""
+        self._load_builtins()
+        if sender:
+            name = self._sender_domain(sender)
+            if name:
+                return name
+        markers = self._markers()
+        if markers is not None and text:
+            m = markers.search(text)
+            if m:
+                return self.by_marker[m.group(0).lower()]
+        return self.default
+
+    def get(self, text, sender=None):
+        name = self.detect(text, sender)
+        if name is None:
+            raise LookupError(f"No {self.kind} parser registered")
+        return self.parsers[name]
+
+
+ALERT_PARSERS = ParserRegistry("alert", builtin_modules=("preprocess_emails",))
+STATEMENT_PARSERS = ParserRegistry("statement", builtin_modules=("extract_statement",))
+
+
+def register_alert_parser(name, senders=(), markers=(), default=False):
+    def decorator(parser):
+        return ALERT_PARSERS.register(name, parser, senders, markers, default)
+    return decorator
+
+
+def register_statement_parser(name, markers=(), default=False):
+    """parser(pdf_path, pdf_password) -> list of transaction dicts"""
+    def decorator(parser):
+        return STATEMENT_PARSERS.register(name, parser, markers=markers, default=default)
+    return decorator
+
+
+def parse_alert(text, sender=None):
+    return ALERT_PARSERS.get(text, sender)(text)
+
+
+def parse_statement(pdf_path, pdf_password):
+    """Fingerprint the statement from its first page, then run the matching extractor"""
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path, password=pdf_password) as pdf:
+        first_page = pdf.pages[0].extract_text() if pdf.pages else ""
+    return STATEMENT_PARSERS.get(first_page or "")(pdf_path, pdf_password)
@@ -0,0 +1,136 @@
+"""
+Streaming ETL pipeline.
+
+Each stage takes an iterable and yields results, so a record flows
+fetch -> parse -> merchant -> categorise -> hash -> insert without any stage holding the
+whole run in memory. prefetch() runs the (network bound) source in a
+background thread behind a bounded queue, so parsing, categorisation and DB
+writes overlap with Gmail fetches. Peak memory is bounded by batch_size and
+the queue size, not by the size of the backfill window.
+
+    records = hash_stage(categorize_stage(merchant_stage(parse_stage(prefetch(texts)))))
+    inserted, duplicates = load_stage(batch_stage(records, 500))
+"""
+
+import queue
+import threading
+from parser_registry import parse_alert
+from categorise_emails import get_categorizer, merchant_name
+from merchants import add_merchants
+from normalize_functions import generate_hash, load_hash_keys
+from pg_utils import insert_expense
+
+PREFETCH_SIZE = 200
+# How often a producer blocked on a full queue checks whether the consumer left
+PREFETCH_POLL_SECONDS = 0.5
+DB_BATCH_SIZE = 500
+CATEGORIZE_BATCH_SIZE = 200
+MERCHANT_BATCH_SIZE = 200
+
+_DONE = object()
+
+
+def prefetch(iterable, maxsize=PREFETCH_SIZE):
+    """Drive iterable from a background thread, at most maxsize items ahead"""
+    q = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        # A plain put() would block forever once the consumer stops reading
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=PREFETCH_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(e)
+            return
+        put(_DONE)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def parse_stage(mails):
+    """
+    (sender, mail text) -> parsed dict, with the parser chosen by sender first;
+    drops mails without a reference number (as final_result does)
+    """
+    for sender, text in mails:
+        result = parse_alert(text, sender)
+        if result["Reference_number"]:
+            yield result
+
+
+def merchant_stage(records, batch_size=MERCHANT_BATCH_SIZE):
+    """Attach merchant_id / canonical Merchant name, resolving a chunk per DB round trip"""
+    for batch in batch_stage(records, batch_size):
+        yield from add_merchants(batch)
+
+
+def categorize_stage(records, batch_size=CATEGORIZE_BATCH_SIZE):
+    """Categorise in chunks so unknown merchants reach the LLM in batched prompts"""
+    for batch in batch_stage(records, batch_size):
+        categories = get_categorizer().categorize_many(merchant_name(r) for r in batch if r["Paid_to"])
+        for record in batch:
+            if record["Paid_to"]:
+                record["Category"] = categories[merchant_name(record).strip()]
+            else:
+                record["Category"] = "SIP"
+            yield record
+
+
+def hash_stage(records, keys=None):
+    keys = keys or load_hash_keys()
+    for record in records:
+        record["hashcode"] = generate_hash(record, keys)
+        yield record
+
+
+def batch_stage(records, size=DB_BATCH_SIZE):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_stage(batches):
+    """
+    Insert each batch as it arrives. Returns (inserted_count, duplicate_count).
+    Rows with bad data are quarantined; a batch that otherwise fails to load
+    raises (see pg_utils.insert_expense) and stops the run.
+    """
+    inserted = duplicates = 0
+    for batch in batches:
+        batch_inserted, batch_duplicates = insert_expense(batch)
+        inserted += len(batch_inserted)
+        duplicates += len(batch_duplicates)
+    return inserted, duplicates
+
+
+def run_pipeline(texts, batch_size=DB_BATCH_SIZE, prefetch_size=PREFETCH_SIZE):
+    """texts: any iterable of (sender, cleaned mail text) pairs (e.g. extract_emails.iter_message_texts)"""
+    records = hash_stage(categorize_stage(merchant_stage(parse_stage(prefetch(texts, prefetch_size)))))
+    return load_stage(batch_stage(records, batch_size))
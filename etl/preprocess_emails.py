@@ -1,40 +1,65 @@
 import re
+from parser_registry import register_alert_parser, parse_alert
+
+# Compiled once at import. Each pattern starts with a literal ("Rs", "@", "on")
+# so the regex engine can jump straight to candidate positions.
+AMOUNT_RE = re.compile(r"Rs\.?\s?([\d.,]+)")
+PAID_TO_RE = re.compile(r"@[a-zA-Z]+\s+(.+?)\s+on")
+REFERENCE_RE = re.compile(r"reference number is\s+(\d+)", re.IGNORECASE)
+# Same as r"\bon\s+(...)" but without the leading \b, which would disable the
+# literal-prefix scan; the word boundary is checked in search_date instead.
+DATE_RE = re.compile(r"on\s+(\d{1,2}-\d{1,2}-\d{2,4})")
+
+DEBIT_KEYWORDS = ("debited", "upi/dr", "spent", "withdrawn", "purchase")
+CREDIT_KEYWORDS = ("credited", "upi/cr", "received", "refund")
+
 def extract_txn_type(text):
     text = text.lower()
 
     # Debit indicators
-    if ("debited" in text or
-        "upi/dr" in text or
-        "spent" in text or
-        "withdrawn" in text or
-        "purchase" in text):
-        return "Debit"
+    for keyword in DEBIT_KEYWORDS:
+        if keyword in text:
+            return "Debit"
 
     # Credit indicators
-    if ("credited" in text or
-        "upi/cr" in text or
-        "received" in text or
-        "refund" in text):
-        return "Credit"
+    for keyword in CREDIT_KEYWORDS:
+        if keyword in text:
+            return "Credit"
 
     return "Unknown"
 
+def search_date(text):
+    pos = 0
+    while True:
+        m = DATE_RE.search(text, pos)
+        if m is None:
+            return None
+        i = m.start()
+        if i == 0 or not (text[i - 1].isalnum() or text[i - 1] == "_"):
+            return m.group(1)
+        pos = i + 1
+
+@register_alert_parser(
+    "hdfc",
+    senders=["hdfcbank.net", "hdfcbank.bank.in", "hdfcbank.com"],
+    markers=["HDFC Bank", "hdfcbank"],
+    default=True
+)
 def parse_hdfc_text(text):
     # 1. Amount
-    m = re.search(r"Rs\.?\s?([\d.,]+)", text)
+    m = AMOUNT_RE.search(text)
     amount = m.group(1) if m else None
 
     # 2. Paid to (after @xyz and before 'on')
-    m = re.search(r"@[a-zA-Z]+\s+(.+?)\s+on", text)
+    m = PAID_TO_RE.search(text)
     paid_to = m.group(1).strip() if m else None
 
     # 3. Reference number
-    m = re.search(r"reference number is\s+(\d+)", text, re.IGNORECASE)
+    m = REFERENCE_RE.search(text)
     reference_number = m.group(1) if m else None
 
     # 4. Date (after the word 'on')
-    m = re.search(r"\bon\s+(\d{1,2}-\d{1,2}-\d{2,4})", text)
-    date = m.group(1) if m else None
+    date = search_date(text)
 
     type = extract_txn_type(text)
 
@@ -47,10 +72,11 @@ def parse_hdfc_text(text):
     }
 
 def final_result(mails):
+    """mails: (sender, text) pairs as returned by extract_emails.messages_to_text"""
     final_result = []
     if mails and len(mails)>0:
-        for mail in mails:
-            result=parse_hdfc_text(mail)
+        for sender, mail in mails:
+            result=parse_alert(mail, sender)
             if result['Reference_number']:
                 final_result.append(result)
     else:
@@ -0,0 +1,85 @@
+"""
+Deterministic local stand-in for ChatOpenAI, for tests and benchmarks.
+
+Replies are a pure function of the prompt: the prompts used in this repo
+(merchant categorisation, query routing, SQL / Chroma filter / intent
+generation) get a well-formed answer their parsers accept, anything else
+gets a stable placeholder. An optional latency simulates network round
+trips so caching and batching can be measured offline.
+
+    llm = FakeChatModel(latency=0.3)
+    llm.invoke("merchant: ZOMATO LTD ...").content
+Select it everywhere with LLM_BACKEND=fake (see llm_cache.chat_model).
+"""
+
+import hashlib
+import json
+import re
+import time
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+FAKE_CATEGORIES = ("Food", "Person", "Petrol", "Grocery", "Clothing", "Salon", "Hospital", "Sports", "Others")
+ANALYTICAL_WORDS = ("how much", "total", "sum", "count", "average", "biggest", "largest", "max", "min")
+
+BATCH_MERCHANTS_RE = re.compile(r"merchants \(one per line\):\n(.*)\Z", re.S)
+MERCHANT_RE = re.compile(r"^merchant: (.*)$", re.M)
+USER_QUERY_RE = re.compile(r"(?:Query ?:|User:|User query =)\s*\"?(.*?)\"?\s*$", re.M)
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def fake_category(merchant):
+    return FAKE_CATEGORIES[int(_digest(merchant.strip().lower())[:8], 16) % len(FAKE_CATEGORIES)]
+
+
+def fake_reply(prompt):
+    m = BATCH_MERCHANTS_RE.search(prompt)
+    if m:
+        names = [line.strip() for line in m.group(1).splitlines() if line.strip()]
+        return json.dumps({name: fake_category(name) for name in names})
+
+    m = MERCHANT_RE.search(prompt)
+    if m:
+        return '```json\n' + json.dumps({"category": fake_category(m.group(1))}) + '\n```'
+
+    queries = USER_QUERY_RE.findall(prompt)
+    query = queries[-1] if queries else prompt
+    if "Answer only with one word" in prompt:
+        return "analytical" if any(w in query.lower() for w in ANALYTICAL_WORDS) else "semantic"
+    if "Postgres SQL generator" in prompt:
+        return "SELECT COUNT(*) AS result FROM expenses"
+    if "ChromaDB metadata filter" in prompt:
+        return json.dumps({"txn_type": "Debit"})
+    if "intent extraction engine" in prompt:
+        return json.dumps({
+            "metric": "sum",
+            "field": "amount",
+            "filters": {"category": None, "txn_type": "Debit", "month": None, "year": None, "paid_to": None},
+        })
+    return f"[fake answer {_digest(prompt)[:8]}]"
+
+
+class FakeChatModel(BaseChatModel):
+    model_name: str = "fake-local"
+    latency: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fake-local"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": self.model_name}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = "\n".join(m.content for m in messages if isinstance(m.content, str))
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        message = AIMessage(content=fake_reply(prompt))
+        return ChatResult(generations=[ChatGeneration(message=message)])
@@ -0,0 +1,152 @@
+"""
+Persistent cache for LLM responses, shared by every chat model in the repo.
+
+Responses are stored in SQLite keyed by sha256(prompt + model string) -
+LangChain's llm_string carries the model name and sampling parameters, so
+a different model or temperature never reuses an answer. Entries expire
+after ttl seconds, and when the file holds more than max_bytes of
+responses the least recently used ones are evicted.
+
+chat_model() is the one place chat models are built:
+    LLM_BACKEND=openai|fake   real ChatOpenAI or fake_llm.FakeChatModel
+    LLM_CACHE=0               disable the cache
+    LLM_CACHE_PATH / LLM_CACHE_TTL / LLM_CACHE_MAX_BYTES
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.path.join(BASE_DIR, "llm_cache.sqlite")
+CACHE_TTL = 30 * 24 * 3600
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+)
+"""
+
+
+class SQLiteLLMCache(BaseCache):
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_bytes=MAX_CACHE_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # One connection shared by threads (guarded by lock); the busy timeout
+        # and WAL let the cron run and the dashboard use the file together.
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(SCHEMA)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed_idx ON llm_cache (accessed_at)")
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        try:
+            return [loads(g) for g in json.loads(value)]
+        except Exception:
+            return None  # written by an incompatible langchain version: treat as a miss
+
+    def update(self, prompt, llm_string, return_val):
+        key = self._key(prompt, llm_string)
+        value = json.dumps([dumps(g) for g in return_val])
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        # Drop expired entries, then least recently used ones until under 90% of max_bytes
+        if self.ttl is not None:
+            self.conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        for key, size in self.conn.execute(
+            "SELECT key, size FROM llm_cache ORDER BY accessed_at"
+        ).fetchall():
+            if total <= target:
+                break
+            self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+
+    def clear(self, **kwargs):
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache")
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Process-wide cache, or None when LLM_CACHE=0"""
+    global _cache
+    if os.getenv("LLM_CACHE", "1") == "0":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SQLiteLLMCache(
+                    path=os.getenv("LLM_CACHE_PATH", CACHE_PATH),
+                    ttl=float(os.getenv("LLM_CACHE_TTL", CACHE_TTL)),
+                    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", MAX_CACHE_BYTES)),
+                )
+    return _cache
+
+
+def chat_model(**kwargs):
+    """ChatOpenAI (or the local fake) with the shared response cache attached"""
+    cache = get_llm_cache()
+    if cache is not None:
+        kwargs.setdefault("cache", cache)
+    if os.getenv("LLM_BACKEND", "openai") == "fake":
+        from fake_llm import FakeChatModel
+        return FakeChatModel(**kwargs)
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(**kwargs)
@@ -1,4 +1,3 @@
-from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 from langchain.output_parsers import PydanticOutputParser
 from langchain.prompts import PromptTemplate
@@ -7,8 +6,21 @@ from typing import Optional,Literal
 from pg_utils import execute_query
 from rag_utlis import semantic_search
 import json
+import threading
 load_dotenv()
-model = ChatOpenAI()
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """Process-wide chat model, built on the first question"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from llm_cache import chat_model
+                _model = chat_model()
+    return _model
 
 class Filters(BaseModel):
     category: Optional[str]
@@ -31,7 +43,7 @@ def categorise_query(query):
     Query : {user_input} \n
     Answer only with one word
     '''
-    result = model.invoke(query)
+    result = get_model().invoke(query)
     return result.content
 
 def retrieve_intent(query):
@@ -52,7 +64,7 @@ Query: "{user_query}"
         input_variables=["user_query"],
         partial_variables={"format_instructions": parser.get_format_instructions()},
     )
-    chain = prompt | model | parser
+    chain = prompt | get_model() | parser
     return chain.invoke({"user_query": query})
 
 
@@ -80,46 +92,6 @@ MONTH_MAP = {
     "December": 12
 }
 
-def build_sql(query):
-    intent = retrieve_intent(query)
-    print(intent)
-    metric = METRIC_SQL[intent.metric]
-    where_clauses = []
-    params = []
-
-    # Filters
-    f = intent.filters
-
-    if f.category:
-        where_clauses.append(f"category = '{f.category}'")
-        params.append(f.category)
-
-    if f.txn_type:
-        where_clauses.append(f"txn_type = '{f.txn_type}'")
-        params.append(f.txn_type)
-
-    if f.paid_to:
-        where_clauses.append(f"paid_to ILIKE '%{f.paid_to}%'")
-        params.append(f"%{f.paid_to}%")
-
-    if f.month:
-        month = MONTH_MAP[f.month]
-        where_clauses.append(f"EXTRACT(MONTH FROM txn_date) = '{month}'")
-        params.append(MONTH_MAP[f.month])
-
-    if f.year:
-        where_clauses.append(f"EXTRACT(YEAR FROM txn_date) = '{f.year}'")
-        params.append(f.year)
-
-    where_sql = ""
-    if where_clauses:
-        where_sql = "WHERE " + " AND ".join(where_clauses)
-
-    sql = f"""SELECT {metric} ({intent.field}) AS result FROM expenses {where_sql};
-    """
-
-    return sql, params
-
 def create_sql_query(query):
     prompt = f"""
 You are a Postgres SQL generator.
@@ -131,29 +103,48 @@ Rules:
 - NO comments
 - NO extra text
 
-Table: expenses
-Columns: amount, paid_to, txn_date, category, txn_type
+Tables:
+- expense_daily_rollup: one row per day, category and type
+  Columns: txn_date, category, txn_type, total, txn_count
+- expense_monthly_payee_rollup: one row per month, category, type and payee
+  Columns: month (first day of the month), category, txn_type, paid_to, total, txn_count
+- expenses: one row per transaction (large, use only when a rollup cannot answer)
+  Columns: amount, paid_to, txn_date, category, txn_type
 
 Rules:
 - txn_type ∈ ('Debit', 'Credit')
 - If category is mentioned → txn_type = 'Debit'
-- Use EXTRACT(MONTH FROM txn_date) = <number>
-- Use EXTRACT(YEAR FROM txn_date) = <year>
+- Totals, counts and averages come from the rollups:
+  SUM(total), SUM(txn_count), SUM(total) / NULLIF(SUM(txn_count), 0)
+- Use expense_daily_rollup unless a payee is mentioned; then use
+  expense_monthly_payee_rollup with paid_to ILIKE '%<payee>%'
+- Use expenses only for single transactions (MAX / MIN amount, listing transactions)
+- Filter months and years with date ranges, never with EXTRACT:
+  txn_date (or month) >= DATE '<first day>' AND txn_date (or month) < DATE '<first day of next period>'
+
+Examples:
+User: How much did I spend on food in January 2026?
+Output:
+SELECT SUM(total) AS result
+FROM expense_daily_rollup
+WHERE category = 'Food'
+  AND txn_type = 'Debit'
+  AND txn_date >= DATE '2026-01-01'
+  AND txn_date < DATE '2026-02-01';
 
-Example:
 User: Which is biggest expense on petrol in January 2026?
 Output:
 SELECT MAX(amount) AS result
 FROM expenses
 WHERE category = 'Petrol'
   AND txn_type = 'Debit'
-  AND EXTRACT(MONTH FROM txn_date) = 1
-  AND EXTRACT(YEAR FROM txn_date) = 2026;
+  AND txn_date >= DATE '2026-01-01'
+  AND txn_date < DATE '2026-02-01';
 
 User: {query}
 """
 
-    result = model.invoke(prompt)
+    result = get_model().invoke(prompt)
     return result.content.strip()
 
 def create_chroma_filter(query):
@@ -210,20 +201,20 @@ Output:
   ]
 }
 """ + f"User: {query}"
-    result = model.invoke(prompt)
+    result = get_model().invoke(prompt)
     return json.loads(result.content.strip())
 
 
 def rag_ans(query,semantic_ans):
     prompt = f'''You are an analyst and you will be passed a semantic query by user along with the matching documnets from our data. Your work is to analyze the query and
     give appropriate answers based on relevant documents you will be passed \n User query = {query} \n Relevant Documents : {semantic_ans}'''
-    result = model.invoke(prompt)
+    result = get_model().invoke(prompt)
     return result.content.strip()
 
 def sql_answer(query,sql_ans):
     prompt = f"""You are an analyst you will be passed a analytical query by user and also its answer which is a output of sql query you have to 
 properly examine the query and output and properly form the answer in a human tone dont add keywords like SQL or technical .\n User query = {query} \n SQL Answer : {sql_ans}"""
-    result = model.invoke(prompt)
+    result = get_model().invoke(prompt)
     return result.content.strip()
 
 def chatbot_ans(query):
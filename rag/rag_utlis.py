@@ -1,8 +1,11 @@
-from pg_utils import get_all_data,get_today_data
-from sentence_transformers import SentenceTransformer
-import chromadb
+from pg_utils import get_all_data,get_today_data,iter_all_data,iter_data_since,current_xmin,has_column
+import json
+import os
+import threading
 #from chromadb.config import Settings
 CHROMA_DIR = "chroma_store"
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+SYNC_STATE_FILE = os.path.join(CHROMA_DIR, "sync_state.json")
 MONTH_MAP = {
     "01":"January" ,
     "02":"February",
@@ -19,12 +22,52 @@ MONTH_MAP = {
 }
 
 
+EMBED_BATCH_SIZE = 1000
+
+# sentence_transformers (torch) and chromadb are slow to import and load, so the
+# model and client are process-wide singletons built on first use.
+_embedding_model = None
+_chroma_client = None
+_singleton_lock = threading.Lock()
+
+
+def get_embedding_model():
+    global _embedding_model
+    if _embedding_model is None:
+        with _singleton_lock:
+            if _embedding_model is None:
+                from sentence_transformers import SentenceTransformer
+                _embedding_model = SentenceTransformer(EMBED_MODEL_NAME)
+    return _embedding_model
+
+
+def get_chroma_client():
+    global _chroma_client
+    if _chroma_client is None:
+        with _singleton_lock:
+            if _chroma_client is None:
+                import chromadb
+                _chroma_client = chromadb.PersistentClient(path=CHROMA_DIR)
+    return _chroma_client
+
+
 def get_records(dedup: bool = False):
     if dedup:
         return get_all_data()      # full dataset
     else:
         return get_today_data()    # fast path
 
+def iter_record_batches(dedup: bool = False, batch_size: int = EMBED_BATCH_SIZE):
+    """
+    Same rows as get_records, but as batches so the full table never sits in memory.
+    """
+    if dedup:
+        yield from iter_all_data(batch_size=batch_size)   # server-side cursor
+    else:
+        rows = get_today_data()
+        for i in range(0, len(rows), batch_size):
+            yield rows[i:i+batch_size]
+
 def filter_existing(collection, rows):
     existing_ids = set()
 
@@ -62,30 +105,17 @@ def clean_metadata(row: dict):
     return cleaned
 
 
-def run_embedding_pipeline(dedup=False):
-    rows = get_records(dedup=dedup)
-
-    if not rows:
-        print("ℹ️ No records to process")
-        return
-    client = chromadb.PersistentClient(path=CHROMA_DIR)
-
-    collection = client.get_or_create_collection("expenses")
-
-    if dedup:
-        rows = filter_existing(collection, rows)
-        if not rows:
-            print("ℹ️ All records already embedded")
-            return
-
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    cleaned_rows = [clean_metadata(r) for r in rows]
-    texts = [
+def build_texts(cleaned_rows):
+    return [
         f"On {r['txn_date']} you made a {r['txn_type']} transaction "
         f"of ₹{r['amount']} for {r['category']}  to {r['paid_to']}."
         for r in cleaned_rows
     ]
 
+def embed_rows(collection, model, rows):
+    cleaned_rows = [clean_metadata(r) for r in rows]
+    texts = build_texts(cleaned_rows)
+
     embeddings = model.encode(texts).tolist()
 
     collection.add(
@@ -95,21 +125,83 @@ def run_embedding_pipeline(dedup=False):
         ids=[r["hashcode"] for r in rows]
     )
 
-    print(f"✅ Embedded {len(rows)} records")
+def run_embedding_pipeline(dedup=False, batch_size=EMBED_BATCH_SIZE):
+    collection = get_chroma_client().get_or_create_collection("expenses")
 
+    seen = 0
+    embedded = 0
+
+    # One batch in memory at a time: fetch -> filter -> encode -> add
+    for rows in iter_record_batches(dedup=dedup, batch_size=batch_size):
+        seen += len(rows)
+        if dedup:
+            rows = filter_existing(collection, rows)
+        if not rows:
+            continue
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+        embed_rows(collection, get_embedding_model(), rows)
+        embedded += len(rows)
 
-client = chromadb.PersistentClient(path="./chroma_store")
-collection = client.get_collection("expenses")
+    if not seen:
+        print("ℹ️ No records to process")
+        return
+    if not embedded:
+        print("ℹ️ All records already embedded")
+        return
+
+    print(f"✅ Embedded {embedded} records")
+
+def load_watermark(path=SYNC_STATE_FILE):
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r") as f:
+        return json.load(f).get("last_xmin", 0)
+
+def save_watermark(last_xmin, path=SYNC_STATE_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"last_xmin": last_xmin}, f)
+    os.replace(tmp, path)
+
+def run_incremental_sync(batch_size=EMBED_BATCH_SIZE):
+    """
+    Embed only rows inserted since the last successful sync, whatever their txn_date.
+
+    The watermark is the snapshot xmin taken before reading: every transaction
+    below it had finished, so nothing it wrote can still appear. Rows from
+    transactions at or above it (possibly uncommitted then) are read again next
+    time and filter_existing drops the ones already embedded. The watermark
+    lives next to the Chroma store, so wiping the store resets it.
+    expenses.ingest_xid comes from schema migration 7 (python db/schema.py).
+    """
+    if not has_column("expenses", "ingest_xid"):
+        raise RuntimeError("expenses.ingest_xid is missing; run python db/schema.py first")
+    collection = get_chroma_client().get_or_create_collection("expenses")
+
+    last_xmin = load_watermark()
+    next_xmin = current_xmin()
+    embedded = 0
+
+    for rows in iter_data_since(last_xmin, batch_size=batch_size):
+        rows = filter_existing(collection, rows)
+        if rows:
+            embed_rows(collection, get_embedding_model(), rows)
+            embedded += len(rows)
+    save_watermark(next_xmin)
+
+    if not embedded:
+        print("ℹ️ No new records to embed")
+        return
 
+    print(f"✅ Embedded {embedded} new records (watermark {next_xmin})")
 
 def semantic_search(query,filter_query):
     #run_embedding_pipeline()
+    collection = get_chroma_client().get_collection("expenses")
     filtered = collection.get(where=filter_query)
     total = len(filtered["ids"])
 
-    query_embedding = model.encode(query).tolist()
+    query_embedding = get_embedding_model().encode(query).tolist()
 
     results = collection.query(
         query_embeddings=[query_embedding],
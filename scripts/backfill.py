@@ -0,0 +1,140 @@
+"""
+Backfill the expenses table from Gmail alerts over a date range.
+
+The range is split into windows that are listed, fetched and parsed
+concurrently by a worker pool (one Gmail service per worker thread); at
+most --workers windows are in flight, so parsed rows waiting to be
+inserted stay bounded however long the range is.
+Categorisation, hashing and inserts stay on the main thread, because the
+categoriser learns rules as it goes. A window is recorded in the checkpoint
+file only once its rows are in the database; the first window that fails
+to fetch or insert stops the run, and it (with every window not yet
+finished) is retried on the next run.
+
+Run:  python backfill.py 2025-01-01 2025-12-31 [--window-days 7] [--workers 4] [--restart]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+# etl/, db/ and rag/ importable without PYTHONPATH, as in driver_code
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for package_dir in ("rag", "db", "etl"):
+    path = os.path.join(ROOT_DIR, package_dir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from googleapiclient.discovery import build
+from extract_emails import set_creds, list_messages_in_range, messages_to_text
+from message_cache import get_default_cache
+from preprocess_emails import final_result
+from categorise_emails import categorize
+from normalize_functions import add_hash
+from pg_utils import insert_expense
+from schema import apply_migrations
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHECKPOINT_PATH = os.path.join(BASE_DIR, "backfill_checkpoint.json")
+
+
+def split_windows(start, end, window_days):
+    """[start, end] inclusive -> list of (window_start, window_end_exclusive)"""
+    windows = []
+    current = start
+    last = end + timedelta(days=1)
+    while current < last:
+        window_end = min(current + timedelta(days=window_days), last)
+        windows.append((current, window_end))
+        current = window_end
+    return windows
+
+
+def window_key(window):
+    return f"{window[0]:%Y-%m-%d}/{window[1]:%Y-%m-%d}"
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r") as f:
+        return set(json.load(f).get("done", []))
+
+
+def save_checkpoint(path, done):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"done": sorted(done)}, f, indent=4)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill expenses from Gmail alerts")
+    parser.add_argument("start", help="YYYY-MM-DD (inclusive)")
+    parser.add_argument("end", help="YYYY-MM-DD (inclusive)")
+    parser.add_argument("--window-days", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--restart", action="store_true", help="ignore finished windows in the checkpoint")
+    args = parser.parse_args()
+
+    # The insert path needs merchant_id and the rollup tables
+    apply_migrations()
+    start = datetime.strptime(args.start, "%Y-%m-%d")
+    end = datetime.strptime(args.end, "%Y-%m-%d")
+    done = set() if args.restart else load_checkpoint(args.checkpoint)
+    windows = [w for w in split_windows(start, end, args.window_days) if window_key(w) not in done]
+    print(f"{len(windows)} windows to backfill ({len(done)} already done)")
+
+    creds = set_creds()
+    # Built once here and shared: the workers must not race to create it
+    cache = get_default_cache()
+    local = threading.local()
+
+    def fetch_window(window):
+        # googleapiclient services are not thread-safe: one per worker
+        if not hasattr(local, "service"):
+            local.service = build('gmail', 'v1', credentials=creds)
+        messages = list_messages_in_range(local.service, window[0], window[1], cache=cache)
+        return final_result(messages_to_text(local.service, messages, cache=cache))
+
+    total = 0
+    pending_windows = iter(windows)
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        in_flight = {}
+
+        def submit_next():
+            window = next(pending_windows, None)
+            if window is not None:
+                in_flight[pool.submit(fetch_window, window)] = window
+
+        for _ in range(args.workers):
+            submit_next()
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            future = finished.pop()
+            window = in_flight.pop(future)
+            try:
+                parsed = future.result()
+                if parsed:
+                    # Raises (InsertError / OperationalError) unless every row was stored or quarantined
+                    insert_expense(add_hash(categorize(parsed)))
+            except Exception as e:
+                print(f"❌ {window_key(window)} failed, stopping (left pending): {e}")
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            done.add(window_key(window))
+            save_checkpoint(args.checkpoint, done)
+            total += len(parsed)
+            print(f"✅ {window_key(window)}: {len(parsed)} transactions")
+            submit_next()
+
+    print(f"Backfill finished: {total} transactions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark: sequential messages.get vs gmail_fetch.fetch_messages
+against a local fake Gmail service (no network, no credentials).
+
+Run:  PYTHONPATH=etl python scripts/bench_gmail_fetch.py [n_messages] [latency_ms]
+"""
+
+import sys
+import threading
+import time
+from base64 import urlsafe_b64encode
+from gmail_fetch import fetch_messages
+
+
+class FakeResp:
+    def __init__(self, status):
+        self.status = status
+
+
+class FakeHttpError(Exception):
+    """Mimics googleapiclient.errors.HttpError: .resp.status and .content"""
+    def __init__(self, status, content=b""):
+        super().__init__(f"HTTP {status}")
+        self.resp = FakeResp(status)
+        self.content = content
+
+
+class FakeRequest:
+    def __init__(self, service, msg_id):
+        self.service = service
+        self.msg_id = msg_id
+
+    def execute(self):
+        time.sleep(self.service.latency)
+        return self.service.respond(self.msg_id)
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        # One round trip for the whole batch
+        time.sleep(self.service.latency)
+        for request_id, request in self.requests:
+            try:
+                self.callback(request_id, self.service.respond(request.msg_id), None)
+            except FakeHttpError as e:
+                self.callback(request_id, None, e)
+
+
+class FakeGmailService:
+    """
+    Serves synthetic HDFC alert messages. Every rate_limit_every-th get fails
+    once with a 429 so the retry path is exercised.
+    """
+    def __init__(self, n_messages, latency=0.05, rate_limit_every=0):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.calls = 0
+        self.failed = set()
+        self.lock = threading.Lock()
+        self.store = {f"m{i}": self._message(i) for i in range(n_messages)}
+
+    @staticmethod
+    def _message(i):
+        html = (
+            f"<html><body><p>Dear Customer,</p><p>Rs.{100 + i}.00 has been debited from account **1234 "
+            f"to VPA shop{i}@okaxis SHOP {i} on 09-02-26.</p>"
+            f"<p>Your UPI transaction reference number is {400000000000 + i}.</p></body></html>"
+        )
+        data = urlsafe_b64encode(html.encode()).decode()
+        return {"id": f"m{i}", "payload": {"mimeType": "text/html", "body": {"data": data}}}
+
+    def respond(self, msg_id):
+        with self.lock:
+            self.calls += 1
+            if self.rate_limit_every and self.calls % self.rate_limit_every == 0 and msg_id not in self.failed:
+                self.failed.add(msg_id)
+                raise FakeHttpError(429)
+        return self.store[msg_id]
+
+    # discovery-client surface
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def get(self, userId, id, format):
+        return FakeRequest(self, id)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = (int(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    ids = [f"m{i}" for i in range(n)]
+    no_sleep = lambda s: None
+
+    service = FakeGmailService(n, latency=latency)
+    start = time.perf_counter()
+    sequential = [service.users().messages().get(userId="me", id=i, format="full").execute() for i in ids]
+    t_seq = time.perf_counter() - start
+
+    service = FakeGmailService(n, latency=latency, rate_limit_every=37)
+    start = time.perf_counter()
+    batched = fetch_messages(service, ids, mode="batch", sleep=no_sleep)
+    t_batch = time.perf_counter() - start
+
+    service = FakeGmailService(n, latency=latency, rate_limit_every=37)
+    factory = lambda: FakeGmailService(n, latency=latency, rate_limit_every=37)
+    start = time.perf_counter()
+    threaded = fetch_messages(service, ids, mode="threads", service_factory=factory, sleep=no_sleep)
+    t_threads = time.perf_counter() - start
+
+    assert batched == sequential and threaded == sequential, "fetch engine changed results"
+    print(f"{n} messages, {latency * 1000:.0f} ms per round trip")
+    print(f"sequential : {t_seq:7.3f}s")
+    print(f"batch      : {t_batch:7.3f}s  ({t_seq / t_batch:5.1f}x)")
+    print(f"threads    : {t_threads:7.3f}s  ({t_seq / t_threads:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
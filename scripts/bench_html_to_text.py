@@ -0,0 +1,86 @@
+"""
+Benchmark: BeautifulSoup vs fast HTMLParser text extraction on alert bodies.
+
+Uses the stored alert HTML in etl/gmail_cache when present, otherwise a
+synthetic corpus shaped like HDFC alert templates, plus a few documents
+with malformed entities. Fails if the two extractors disagree on any
+document. (They do differ on references to control characters such as
+"&#1;", see html_text; alert mail does not contain those.)
+
+Run:  PYTHONPATH=etl python scripts/bench_html_to_text.py [n_synthetic]
+"""
+
+import sys
+import time
+from extract_emails import extract_full_html
+from html_text import EXTRACTORS
+from message_cache import get_default_cache
+
+TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><style>td {{ font-family: Arial; }}</style></head>
+<body>
+<table width="100%"><tr><td>
+<p>Dear Customer,</p>
+<p>Rs.{amount} has been debited from account **{acct} to VPA {vpa}@okaxis {payee} on {date}.</p>
+<p>Your UPI transaction reference number is {ref}.</p>
+<p>If you did not authorize this transaction, please report it immediately by calling 18002586161
+or SMS BLOCK UPI to 7308080808.</p>
+<!-- footer -->
+<p>Warm Regards,<br/>HDFC Bank</p>
+<p style="font-size:10px">&copy; HDFC Bank &nbsp;|&nbsp; This is a system generated mail.</p>
+</td></tr></table>
+</body></html>"""
+
+
+# Unknown, unterminated and run-on entity names, which html.unescape would resolve differently
+MALFORMED_ENTITIES = [
+    "<p>Rs.&nbsp;100 &foo; debited &ampx to &copy HDFC</p>",
+    "<p>&notit; &notin; &not &AMP; &Amp; a&b c&d;</p>",
+    "<p>&#150; &#x41; &#65x &#xZZ; &#; &# &</p>",
+]
+
+
+def synthetic_corpus(n):
+    return MALFORMED_ENTITIES + [
+        TEMPLATE.format(
+            amount=f"{100 + i % 9000}.00",
+            acct=f"{i % 10000:04d}",
+            vpa=f"merchant{i}",
+            payee=f"MERCHANT NAME {i % 500}",
+            date=f"{1 + i % 28:02d}-{1 + i % 12:02d}-26",
+            ref=400000000000 + i
+        )
+        for i in range(n)
+    ]
+
+
+def cached_corpus():
+    return [extract_full_html(msg["payload"]) for msg in get_default_cache().iter_messages()]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    corpus = cached_corpus()
+    source = "gmail_cache"
+    if not corpus:
+        corpus = synthetic_corpus(n)
+        source = "synthetic"
+
+    outputs = {}
+    timings = {}
+    for name, extract in EXTRACTORS.items():
+        start = time.perf_counter()
+        outputs[name] = [extract(html) for html in corpus]
+        timings[name] = time.perf_counter() - start
+
+    mismatches = sum(a != b for a, b in zip(outputs["bs4"], outputs["fast"]))
+    print(f"{len(corpus)} documents ({source})")
+    for name, t in timings.items():
+        print(f"{name:5s}: {t:7.3f}s  {len(corpus) / t:9.0f} docs/s")
+    print(f"speedup: {timings['bs4'] / timings['fast']:.1f}x, mismatches: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
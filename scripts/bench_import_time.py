@@ -0,0 +1,54 @@
+"""
+Benchmark: cold import time of the modules the dashboard and the cron job load.
+
+Each import runs in a fresh interpreter, so nothing is shared between
+measurements; the median of --repeat runs is reported. Heavy clients
+(LLM, SentenceTransformer, Chroma) are built on first use, so importing
+these modules should no longer load any model.
+
+Run:  python scripts/bench_import_time.py [--repeat 5] [module ...]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEARCH_PATH = os.pathsep.join(os.path.join(ROOT, d) for d in ("etl", "rag", "db"))
+DEFAULT_MODULES = ["categorise_emails", "pipeline", "rag_utlis", "llm_query"]
+
+SNIPPET = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+
+def import_time(module):
+    env = dict(os.environ, PYTHONPATH=SEARCH_PATH + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run(
+        [sys.executable, "-c", SNIPPET.format(module=module)],
+        capture_output=True, text=True, env=env, cwd=ROOT,
+    )
+    if proc.returncode != 0:
+        last = proc.stderr.strip().splitlines()[-1:] or ["failed"]
+        raise RuntimeError(last[0])
+    return float(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold import time per module")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        try:
+            times = [import_time(module) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{module:20s}  import failed: {e}")
+            continue
+        print(f"{module:20s}  median {statistics.median(times) * 1000:8.1f} ms  "
+              f"min {min(times) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Benchmark: merchant categorisation against the local fake LLM,
+cold cache vs warm cache.
+
+Uses a throwaway rules file and cache, and a fake model with a simulated
+round-trip latency, so nothing touches OpenAI, Postgres or config/rules.json.
+The second run starts from the same empty rules, so every merchant still
+misses the rules and is answered from the response cache.
+
+Run:  PYTHONPATH=etl:rag python scripts/bench_llm_cache.py [n_merchants] [latency_s]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+tmp = tempfile.mkdtemp(prefix="bench_llm_cache_")
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["LLM_CACHE"] = "1"
+os.environ["LLM_CACHE_PATH"] = os.path.join(tmp, "llm_cache.sqlite")
+
+from categorise_emails import ExpenseCategorizer
+from llm_cache import get_llm_cache
+
+
+def run(merchants, latency):
+    # No neighbour tier: it would load SentenceTransformer and read labels from Postgres
+    categorizer = ExpenseCategorizer(rules_file=os.path.join(tmp, f"rules_{time.time_ns()}.json"), use_neighbours=False)
+    categorizer.llm.latency = latency
+    start = time.perf_counter()
+    result = categorizer.categorize_many(merchants)
+    return result, time.perf_counter() - start, categorizer.llm.calls
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    merchants = [f"MERCHANT {i:05d} PVT LTD" for i in range(n)]
+
+    cold, cold_s, cold_calls = run(merchants, latency)
+    warm, warm_s, warm_calls = run(merchants, latency)
+
+    print(f"{n} unknown merchants, {latency:.2f}s simulated latency")
+    print(f"cold cache: {cold_s:8.3f}s  {cold_calls} model calls")
+    print(f"warm cache: {warm_s:8.3f}s  {warm_calls} model calls")
+    print(f"cache: {get_llm_cache().stats()}")
+    if cold != warm:
+        print("mismatch between cold and warm results")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Micro-benchmark: alert parse throughput, precompiled parser
+(preprocess_emails.parse_hdfc_text) vs the previous inline-regex version.
+
+Checks both produce the same dict for every synthetic alert.
+
+Run:  PYTHONPATH=etl python scripts/bench_parse_alerts.py [n_alerts]
+"""
+
+import random
+import re
+import sys
+import time
+from preprocess_emails import parse_hdfc_text
+
+
+# ---- previous implementation, kept as the reference ----
+def legacy_extract_txn_type(text):
+    text = text.lower()
+    if ("debited" in text or "upi/dr" in text or "spent" in text or
+            "withdrawn" in text or "purchase" in text):
+        return "Debit"
+    if ("credited" in text or "upi/cr" in text or "received" in text or "refund" in text):
+        return "Credit"
+    return "Unknown"
+
+
+def legacy_parse_hdfc_text(text):
+    m = re.search(r"Rs\.?\s?([\d.,]+)", text)
+    amount = m.group(1) if m else None
+    m = re.search(r"@[a-zA-Z]+\s+(.+?)\s+on", text)
+    paid_to = m.group(1).strip() if m else None
+    m = re.search(r"reference number is\s+(\d+)", text, re.IGNORECASE)
+    reference_number = m.group(1) if m else None
+    m = re.search(r"\bon\s+(\d{1,2}-\d{1,2}-\d{2,4})", text)
+    date = m.group(1) if m else None
+    return {
+        "Amount": amount,
+        "Paid_to": paid_to,
+        "Type": legacy_extract_txn_type(text),
+        "Reference_number": reference_number,
+        "Date": date
+    }
+
+
+TEMPLATES = [
+    "Dear Customer,\nRs.{amt} has been debited from account **{acct} to VPA {vpa}@{bank} {payee} on {date}.\n"
+    "Your UPI transaction reference number is {ref}.\nIf you did not authorize this transaction, please report it.",
+    "Dear Customer,\nRs. {amt} is successfully credited to your account **{acct} by VPA {vpa}@{bank} {payee} on {date}.\n"
+    "Your UPI transaction Reference Number is {ref}.\nThank you for banking with us.",
+    "Dear Card Member,\nThank you for using your HDFC Bank Credit Card ending {acct} for Rs {amt} at {payee} on {date}.\n"
+    "Purchase alert only.",
+    "Dear Customer,\nRs.{amt} has been received as a refund on {date}.\nREFERENCE NUMBER IS {ref}",
+]
+PAYEES = ["PK BIRYANI HOUSE", "ZOMATO LTD", "shop onkar", "HINDUSTAN PETROLEUM", "MR RONALD", "DMART on line"]
+
+
+def synthetic_corpus(n, seed=7):
+    rnd = random.Random(seed)
+    return [
+        rnd.choice(TEMPLATES).format(
+            amt=f"{rnd.randint(1, 99999)}.{rnd.randint(0, 99):02d}",
+            acct=f"{rnd.randint(0, 9999):04d}",
+            vpa=f"user{rnd.randint(0, 999)}",
+            bank=rnd.choice(["okaxis", "ybl", "paytm", "okhdfcbank"]),
+            payee=rnd.choice(PAYEES),
+            date=f"{rnd.randint(1, 28):02d}-{rnd.randint(1, 12):02d}-{rnd.choice(['26', '2026'])}",
+            ref=rnd.randint(10 ** 11, 10 ** 12 - 1),
+        )
+        for _ in range(n)
+    ]
+
+
+def throughput(parse, corpus):
+    start = time.perf_counter()
+    results = [parse(text) for text in corpus]
+    elapsed = time.perf_counter() - start
+    return results, len(corpus) / elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    corpus = synthetic_corpus(n)
+
+    legacy, legacy_rate = throughput(legacy_parse_hdfc_text, corpus)
+    fast, fast_rate = throughput(parse_hdfc_text, corpus)
+
+    mismatches = sum(a != b for a, b in zip(legacy, fast))
+    print(f"{n} alerts")
+    print(f"legacy : {legacy_rate:10.0f} alerts/s")
+    print(f"current: {fast_rate:10.0f} alerts/s  ({fast_rate / legacy_rate:.2f}x)")
+    print(f"mismatches: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Benchmark: statement post-processing (amount/type inference and narration
+cleaning) on a synthetic statement, column-wise engine
+(extract_statement.transactions_to_records) vs the previous row loop.
+
+Checks both produce the same records.
+
+Run:  PYTHONPATH=etl python scripts/bench_statement_frame.py [n_rows]
+"""
+
+import math
+import random
+import re
+import sys
+import time
+import pandas as pd
+from extract_statement import transactions_to_records
+
+
+# ---- previous implementation, kept as the reference ----
+def legacy_clean_amount(val):
+    if not val:
+        return None
+    try:
+        cleaned = val.replace(",", "").strip()
+        return float(cleaned) if cleaned else None
+    except (ValueError, AttributeError):
+        return None
+
+
+def legacy_clean_narration(narration):
+    if not narration:
+        return None
+    if 'UPI-' in narration:
+        parts = narration.split('UPI-', 1)
+        if len(parts) > 1:
+            after_upi = parts[1]
+            if '@' in after_upi:
+                before_at = after_upi.split('@')[0]
+                last_dash_idx = before_at.rfind('-')
+                if last_dash_idx > 0:
+                    merchant_name = before_at[:last_dash_idx].strip()
+                    if merchant_name:
+                        return merchant_name
+                else:
+                    merchant_name = before_at.strip()
+                    if merchant_name:
+                        return merchant_name
+            merchant = re.sub(r'-[A-Z0-9]{10,}.*$', '', after_upi)
+            merchant = merchant.strip()
+            if merchant:
+                return merchant
+    return narration.strip()
+
+
+def legacy_transactions_to_records(all_transactions):
+    df = pd.DataFrame(all_transactions)
+    if len(df) == 0:
+        return pd.DataFrame(columns=['Date', 'Narration', 'ChqNo', 'Type', 'Amount'])
+
+    df['Amount_Clean'] = df['Amount'].apply(legacy_clean_amount)
+    df['Balance_Clean'] = df['Balance'].apply(legacy_clean_amount)
+    df['Type'] = None
+    df['Final_Amount'] = None
+
+    for i in range(len(df)):
+        if i == 0:
+            if df.loc[i, 'Amount_Clean']:
+                df.loc[i, 'Type'] = 'Debit'
+                df.loc[i, 'Final_Amount'] = df.loc[i, 'Amount_Clean']
+        else:
+            prev_bal = df.loc[i-1, 'Balance_Clean']
+            curr_bal = df.loc[i, 'Balance_Clean']
+            if prev_bal and curr_bal:
+                delta = curr_bal - prev_bal
+                if delta < 0:
+                    df.loc[i, 'Type'] = 'Debit'
+                    df.loc[i, 'Final_Amount'] = abs(delta)
+                elif delta > 0:
+                    df.loc[i, 'Type'] = 'Credit'
+                    df.loc[i, 'Final_Amount'] = abs(delta)
+
+    df['Narration_Clean'] = df['Narration'].apply(legacy_clean_narration)
+    result = df[['Final_Amount', 'Narration_Clean', 'Type', 'ChqNo', 'Date']].copy()
+    result.columns = ['Amount', 'Paid_to', 'Type', 'Reference_number', 'Date']
+    return result.to_dict('records')
+
+
+NARRATIONS = [
+    "UPI-PK BIRYANI HOUSE-paytmqr2810050501011@paytm-YESB0PTMUPI-512345678901-UPI",
+    "UPI-MR RONALD D SOUZA-ronald.dsouza@okaxis-UTIB0000123-512345678902-PAYMENT",
+    "UPI-ZOMATO LTD-zomato@hdfcbank",
+    "UPI--abc@ybl",
+    "UPI-@ybl",
+    "UPI-NEWKAILASHFOODS BH-ABCDEFGHIJKL1234 REF",
+    "UPI-SHOP ONKAR",
+    "UPI-",
+    "NEFT CR-HDFC0000001-ACME PAYROLL",
+    "ATW-512345XXXXXX1234-S1ANPN12-PUNE",
+    "  POS 4321XXXX DMART ONLINE  ",
+    "",
+]
+
+
+def synthetic_statement(n, seed=11):
+    rnd = random.Random(seed)
+    rows = []
+    balance = 50000.0
+    for i in range(n):
+        amount = round(rnd.uniform(1, 5000), 2)
+        roll = rnd.random()
+        if roll < 0.6:
+            balance -= amount
+        elif roll < 0.9:
+            balance += amount
+        # else: balance unchanged (no type)
+        bal = f"{balance:,.2f}" if balance > 0 else "0"
+        if rnd.random() < 0.02:
+            bal = None
+        amt = f"{amount:,.2f}" if rnd.random() > 0.02 else rnd.choice([None, "", "0"])
+        rows.append({
+            "Date": f"{rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}/25",
+            "Narration": rnd.choice(NARRATIONS),
+            "ChqNo": f"{rnd.randint(10 ** 15, 10 ** 16 - 1)}" if rnd.random() < 0.5 else None,
+            "Amount": amt,
+            "Balance": bal,
+        })
+    return rows
+
+
+def same(a, b):
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return a == b
+
+
+def timed(fn, rows):
+    start = time.perf_counter()
+    out = fn(rows)
+    return out, time.perf_counter() - start
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rows = synthetic_statement(n)
+
+    legacy, legacy_s = timed(legacy_transactions_to_records, rows)
+    fast, fast_s = timed(transactions_to_records, rows)
+
+    mismatches = sum(
+        1 for x, y in zip(legacy, fast)
+        if x.keys() != y.keys() or not all(same(x[k], y[k]) for k in x)
+    )
+    print(f"{n} statement rows")
+    print(f"legacy row loop : {legacy_s:8.3f}s")
+    print(f"column-wise     : {fast_s:8.3f}s  ({legacy_s / fast_s:.1f}x)")
+    print(f"mismatches: {mismatches}")
+    if mismatches or len(legacy) != len(fast):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,40 @@
+import os
+import sys
+# Run directly by cron: make etl/, db/ and rag/ importable (etl/ also imports
+# rag/llm_cache and rag/rag_utlis), whatever PYTHONPATH the job has
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for package_dir in ("rag", "db", "etl"):
+    path = os.path.join(ROOT_DIR, package_dir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
 from googleapiclient.discovery import build
-from extract_emails import fetch_emails,set_creds,fetch_emails_by_date
-from preprocess_emails import final_result
-from categorise_emails import categorize
-from normalize_functions import add_hash
-from pg_utils import insert_expense
-from extract_statement import extract_bank_statement
+from extract_emails import set_creds,iter_message_texts
+from schema import apply_migrations
+from rag_utlis import run_incremental_sync
+from gmail_sync import sync_messages, save_sync_state, is_bank_alert
+from pipeline import run_pipeline
 
 # PDF_PATH = "Novemeber_statement.pdf"
 # PDF_PASSWORD = "308327029"
+# Bring the schema up to date (merchant_id, merchants, ...) before any insert
+apply_migrations()
 service = build('gmail', 'v1', credentials=set_creds())
 # mails = fetch_emails(service)
-mails = fetch_emails_by_date(service,"2026-02-09")
-email_result = final_result(mails)
+# mails = fetch_emails_by_date(service,"2026-02-09")
+messages, history_id = sync_messages(service)
+# fetch -> parse -> categorise -> hash -> insert, streamed in batches.
+# Rows with bad data are quarantined (db/rejected_expenses.jsonl) and skipped;
+# run_pipeline raises only if a batch or row fails for another reason
+# (OperationalError, pg_utils.InsertError), so the historyId below is only saved
+# after a complete load and a failed run is retried from the same point next time.
+inserted, duplicates = run_pipeline(iter_message_texts(service, messages, keep=is_bank_alert))
 #pdf_result = extract_bank_statement(PDF_PATH, PDF_PASSWORD)
-final_result = email_result
 # if pdf_result:
-#     final_result = email_result + pdf_result
-categorized_result = categorize(final_result)
-hashed_results = add_hash(categorized_result)
-insert_expense(hashed_results)
-#print(hashed_results)
\ No newline at end of file
+#     categorized_result = categorize(pdf_result)
+#     insert_expense(add_hash(categorized_result))
+save_sync_state(history_id)
+# Embed the new rows for the chatbot; a failure here is retried from the same
+# watermark next run and does not hold back the Gmail sync state above
+run_incremental_sync()
+#print(inserted, duplicates)